@@ -3,86 +3,116 @@
 from crewai import Agent
 from langchain_google_genai import ChatGoogleGenerativeAI # Ensure this is the correct import for your version
 from backend.app.core.config import settings
-from backend.app.agents.tools.rag_tool import knowledge_search_tool
+from backend.app.agents.tools.rag_tool import KnowledgeBaseSearchTool
 import traceback
 
 # --- Configure LLM ---
-try:
-    print("--- Initializing LLM for Agents ---")
-    llm = ChatGoogleGenerativeAI(
-        model=settings.GEMINI_MODEL_NAME,
-        google_api_key=settings.GOOGLE_API_KEY,
-        convert_system_message_to_human=True # Often needed for compatibility
-    )
-    print(f"LLM Initialized: {settings.GEMINI_MODEL_NAME}")
-except Exception as e:
-    print(f"!!! ERROR Initializing LLM for Agents: {e} !!!")
-    traceback.print_exc()
-    llm = None # Crucial to handle LLM initialization failure
+def create_llm():
+    """
+    Creates the chat model for one agent set. Each set gets its own instance because CrewAI
+    attaches per-agent callbacks (e.g. token counting) to the LLM object.
+    """
+    try:
+        print("--- Initializing LLM for Agents ---")
+        llm = ChatGoogleGenerativeAI(
+            model=settings.GEMINI_MODEL_NAME,
+            google_api_key=settings.GOOGLE_API_KEY,
+            convert_system_message_to_human=True # Often needed for compatibility
+        )
+        print(f"LLM Initialized: {settings.GEMINI_MODEL_NAME}")
+        return llm
+    except Exception as e:
+        print(f"!!! ERROR Initializing LLM for Agents: {e} !!!")
+        traceback.print_exc()
+        return None # Crucial to handle LLM initialization failure
 
 # --- Define Agents ---
+# Agents are mutable (CrewAI stores the crew, tool results and executors on them), so they are
+# not shared between crews. Each crew run gets a complete AgentSet of its own; see crew/agent_pool.py.
+
+class AgentSet:
+    """One isolated set of the four legal agents, with its own LLM and search tool instances."""
+
+    def __init__(self, legal_advisor, labour_law_expert, civil_law_expert, fiscal_law_expert, llm, search_tool):
+        self.legal_advisor = legal_advisor
+        self.labour_law_expert = labour_law_expert
+        self.civil_law_expert = civil_law_expert
+        self.fiscal_law_expert = fiscal_law_expert
+        self.llm = llm
+        self.search_tool = search_tool
+
+    @property
+    def agents(self) -> list:
+        return [self.legal_advisor, self.labour_law_expert, self.civil_law_expert, self.fiscal_law_expert]
+
+def build_agent_set() -> AgentSet:
+    """Builds a fresh, independent set of legal agents."""
+    llm = create_llm()
+    knowledge_search_tool = KnowledgeBaseSearchTool()
 
-legal_advisor = Agent(
-    role="Lead Legal Advisor and Consolidator",
-    goal="""Act as the primary client interface. Understand the client's query, identify core legal issues,
-            determine necessary areas of legal expertise, explicitly stating if an area is NOT relevant for direct analysis for the core query.
-            Coordinate expert agents, and finally consolidate the expert analyses (including any 'not applicable' statements) into a coherent final response
-            that addresses the client's needs comprehensively.""", 
-    backstory="""You are a highly experienced legal professional acting as a case manager and lead counsel.
-                 You excel at client communication, issue spotting, and delegating tasks.
-                 You clearly define which experts are needed and what specific questions they should address for the client's core query.
-                 If an expert domain (e.g., Labour Law, Fiscal Law) is not directly relevant to the client's immediate question, you will explicitly note this in your plan so that the expert can confirm without deep analysis.
-                 After receiving analyses from relevant experts (or their confirmation of non-relevance), you synthesize these findings into a single, clear,
-                 and actionable document for the client. You ensure the final output is well-structured and directly
-                 answers the initial query, incorporating all pertinent information.
-                 You DO NOT provide initial legal analysis yourself, but rely on the experts for domain-specific insights.""", 
-    llm=llm,
-    verbose=True,
-    allow_delegation=True
-)
+    legal_advisor = Agent(
+        role="Lead Legal Advisor and Consolidator",
+        goal="""Act as the primary client interface. Understand the client's query, identify core legal issues,
+                determine necessary areas of legal expertise, explicitly stating if an area is NOT relevant for direct analysis for the core query.
+                Coordinate expert agents, and finally consolidate the expert analyses (including any 'not applicable' statements) into a coherent final response
+                that addresses the client's needs comprehensively.""", 
+        backstory="""You are a highly experienced legal professional acting as a case manager and lead counsel.
+                     You excel at client communication, issue spotting, and delegating tasks.
+                     You clearly define which experts are needed and what specific questions they should address for the client's core query.
+                     If an expert domain (e.g., Labour Law, Fiscal Law) is not directly relevant to the client's immediate question, you will explicitly note this in your plan so that the expert can confirm without deep analysis.
+                     After receiving analyses from relevant experts (or their confirmation of non-relevance), you synthesize these findings into a single, clear,
+                     and actionable document for the client. You ensure the final output is well-structured and directly
+                     answers the initial query, incorporating all pertinent information.
+                     You DO NOT provide initial legal analysis yourself, but rely on the experts for domain-specific insights.""", 
+        llm=llm,
+        verbose=True,
+        allow_delegation=True
+    )
 
-labour_law_expert = Agent(
-    role="International Labour Law Expert (Civil Servant Focus)",
-    goal="""Provide precise and actionable legal analysis on international civil servant labour law matters relevant to the client's case,
-            ONLY IF specific questions related to this domain were clearly directed to you by the Lead Legal Advisor for the current client query.
-            If the Lead Legal Advisor's plan indicates no specific labour law questions for this query, your primary task is to briefly confirm that your specific expertise is not required for the central query.
-            If analysis IS required, use the provided knowledge base search tool to find relevant regulations, treaties, and precedents.""", 
-    backstory="""You are a specialist lawyer with 15 years of focused experience in international civil servant labour law.
-                 You respond efficiently to specific analytical requests from the Lead Legal Advisor. If the Advisor's plan for the client's query
-                 does not contain specific questions for your domain, you understand that a detailed analysis is not needed for *this specific query* and will state so.
-                 When analysis is required, you MUST use the 'Legal Knowledge Base Search' tool to ground your analysis in specific legal sources.""", 
-    llm=llm,
-    verbose=True,
-    tools=[knowledge_search_tool],
-    allow_delegation=False
-)
+    labour_law_expert = Agent(
+        role="International Labour Law Expert (Civil Servant Focus)",
+        goal="""Provide precise and actionable legal analysis on international civil servant labour law matters relevant to the client's case,
+                ONLY IF specific questions related to this domain were clearly directed to you by the Lead Legal Advisor for the current client query.
+                If the Lead Legal Advisor's plan indicates no specific labour law questions for this query, your primary task is to briefly confirm that your specific expertise is not required for the central query.
+                If analysis IS required, use the provided knowledge base search tool to find relevant regulations, treaties, and precedents.""", 
+        backstory="""You are a specialist lawyer with 15 years of focused experience in international civil servant labour law.
+                     You respond efficiently to specific analytical requests from the Lead Legal Advisor. If the Advisor's plan for the client's query
+                     does not contain specific questions for your domain, you understand that a detailed analysis is not needed for *this specific query* and will state so.
+                     When analysis is required, you MUST use the 'Legal Knowledge Base Search' tool to ground your analysis in specific legal sources.""", 
+        llm=llm,
+        verbose=True,
+        tools=[knowledge_search_tool],
+        allow_delegation=False
+    )
 
-civil_law_expert = Agent(
-    role="Portuguese Civil Law Expert",
-    goal="""Provide accurate and detailed legal analysis on Portuguese civil law aspects pertinent to the client's situation,
-            based on the specific questions and context provided by the Lead Legal Advisor.
-            Utilize the knowledge base search tool to reference specific articles of the Portuguese Civil Code and relevant jurisprudence.""", 
-    backstory="""You are a seasoned Portuguese lawyer specializing in civil law (Código Civil Português) with 10 years of practical experience.
-                 You respond to specific analytical requests from the Lead Legal Advisor regarding Portuguese Civil Law.
-                 You MUST use the 'Legal Knowledge Base Search' tool to support your analysis with references from the knowledge base.""",
-    llm=llm,
-    verbose=True,
-    tools=[knowledge_search_tool],
-    allow_delegation=False
-)
+    civil_law_expert = Agent(
+        role="Portuguese Civil Law Expert",
+        goal="""Provide accurate and detailed legal analysis on Portuguese civil law aspects pertinent to the client's situation,
+                based on the specific questions and context provided by the Lead Legal Advisor.
+                Utilize the knowledge base search tool to reference specific articles of the Portuguese Civil Code and relevant jurisprudence.""", 
+        backstory="""You are a seasoned Portuguese lawyer specializing in civil law (Código Civil Português) with 10 years of practical experience.
+                     You respond to specific analytical requests from the Lead Legal Advisor regarding Portuguese Civil Law.
+                     You MUST use the 'Legal Knowledge Base Search' tool to support your analysis with references from the knowledge base.""",
+        llm=llm,
+        verbose=True,
+        tools=[knowledge_search_tool],
+        allow_delegation=False
+    )
+
+    fiscal_law_expert = Agent(
+        role="Portuguese Fiscal Law Expert",
+        goal="""Analyze the tax implications of the client's case according to the Portuguese fiscal code,
+                ONLY IF specific questions related to this domain were clearly directed to you by the Lead Legal Advisor for the current client query.
+                If the Lead Legal Advisor's plan indicates no specific fiscal law questions for this query, your primary task is to briefly confirm that your specific expertise is not required for the central query.
+                If analysis IS required, leverage the knowledge base search tool to find relevant tax laws, regulations, and administrative guidance.""", 
+        backstory="""You are a Tax Attorney (Advogado Fiscal) specializing in the Portuguese tax system.
+                     You respond efficiently to specific analytical requests from the Lead Legal Advisor. If the Advisor's plan for the client's query
+                     does not contain specific questions for your domain, you understand that a detailed analysis is not needed for *this specific query* and will state so.
+                     When analysis is required, You MUST use the 'Legal Knowledge Base Search' tool to ensure your analysis is based on current Portuguese fiscal codes and regulations.""", # Backstory updated
+        llm=llm,
+        verbose=True,
+        tools=[knowledge_search_tool],
+        allow_delegation=False
+    )
 
-fiscal_law_expert = Agent(
-    role="Portuguese Fiscal Law Expert",
-    goal="""Analyze the tax implications of the client's case according to the Portuguese fiscal code,
-            ONLY IF specific questions related to this domain were clearly directed to you by the Lead Legal Advisor for the current client query.
-            If the Lead Legal Advisor's plan indicates no specific fiscal law questions for this query, your primary task is to briefly confirm that your specific expertise is not required for the central query.
-            If analysis IS required, leverage the knowledge base search tool to find relevant tax laws, regulations, and administrative guidance.""", 
-    backstory="""You are a Tax Attorney (Advogado Fiscal) specializing in the Portuguese tax system.
-                 You respond efficiently to specific analytical requests from the Lead Legal Advisor. If the Advisor's plan for the client's query
-                 does not contain specific questions for your domain, you understand that a detailed analysis is not needed for *this specific query* and will state so.
-                 When analysis is required, You MUST use the 'Legal Knowledge Base Search' tool to ensure your analysis is based on current Portuguese fiscal codes and regulations.""", # Backstory updated
-    llm=llm,
-    verbose=True,
-    tools=[knowledge_search_tool],
-    allow_delegation=False
-)
\ No newline at end of file
+    return AgentSet(legal_advisor, labour_law_expert, civil_law_expert, fiscal_law_expert, llm, knowledge_search_tool)
@@ -1,6 +1,6 @@
 # backend/app/agents/tools/rag_tool.py
 from langchain.tools import BaseTool
-from typing import Type, Any
+from typing import Type, Any, Optional
 # Corrected import for Pydantic v2 (assuming v2 is installed)
 from pydantic import BaseModel, Field # Use standard Pydantic v2 import
 from backend.app.rag.retriever import search_knowledge_base
@@ -8,24 +8,39 @@ from backend.app.rag.retriever import search_knowledge_base
 class SearchInput(BaseModel):
     query: str = Field(description="The search query string to find relevant legal information in the knowledge base")
 
+# Not instantiated here: the tool holds per-run state, so every AgentSet builds its own (see agents/legal_agents.py)
 class KnowledgeBaseSearchTool(BaseTool):
     name: str = "Legal Knowledge Base Search"
     description: str = (
-        "Searches a specialized knowledge base containing legal texts, regulations, "
-        "and document templates. Use this tool to find specific legal information, "
+        "Searches a specialized knowledge base containing legal texts, regulations "
+        "and case law. Use this tool to find specific legal information, "
         "clauses, precedents, or relevant sections of codes based on the case details."
     )
     args_schema: Type[BaseModel] = SearchInput # This should still work with Pydantic v2 BaseModel
+    retrieval_cache: Optional[Any] = None # The current run's RetrievalCache (see rag/prefetch.py), set by run_crew
+    budget: Optional[Any] = None # The current run's RunBudget (see crew/budget.py), set by run_crew
+    k: int = 5 # Chunks per search while the run is well within its budget
+
+    def _search(self, query: str) -> Any:
+        k = self.k
+        if self.budget is not None:
+            refusal = self.budget.refuse_tool_call()
+            if refusal:
+                return refusal
+            k = self.budget.retrieval_k(k)
+        results = search_knowledge_base(query=query, k=k, cache=self.retrieval_cache)
+        # Handle potential error messages from search_knowledge_base
+        if isinstance(results, list) and results and "Error:" in results[0]:
+            return f"Failed to search knowledge base: {results[0]}"
+        if self.budget is not None:
+            self.budget.charge_tool_call()
+        return results
 
     def _run(self, query: str, **kwargs: Any) -> Any:
         """Use the tool."""
         # Ensure search_knowledge_base is available and working
         try:
-            results = search_knowledge_base(query=query)
-            # Handle potential error messages from search_knowledge_base
-            if isinstance(results, list) and results and "Error:" in results[0]:
-                return f"Failed to search knowledge base: {results[0]}"
-            return results
+            return self._search(query)
         except Exception as e:
             return f"Error executing search tool: {e}"
 
@@ -33,15 +48,7 @@ class KnowledgeBaseSearchTool(BaseTool):
     async def _arun(self, query: str, **kwargs: Any) -> Any:
         """Use the tool asynchronously."""
         # For simplicity, using the sync version. Implement async search if needed.
-        # Add error handling similar to _run
         try:
-            results = search_knowledge_base(query=query)
-            if isinstance(results, list) and results and "Error:" in results[0]:
-                return f"Failed to search knowledge base: {results[0]}"
-            return results
+            return self._search(query)
         except Exception as e:
             return f"Error executing search tool asynchronously: {e}"
-
-
-# Instantiate the tool
-knowledge_search_tool = KnowledgeBaseSearchTool()
\ No newline at end of file
@@ -1,6 +1,15 @@
-from fastapi import APIRouter, HTTPException, Body
+from fastapi import APIRouter, HTTPException, Body, Depends, Header
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from backend.app.crew.legal_crew import run_crew
+from typing import Optional
+from backend.app.core.config import settings
+from backend.app.crew.legal_crew import CrewRunFailed, run_crew
+from backend.app.crew.agent_pool import AgentPoolExhausted
+from backend.app.crew.budget import RunBudget
+from backend.app.crew.scheduler import SchedulerRejected, crew_scheduler, resolve_client
+from backend.app.rag.reindex import reindex_manager
+from backend.app.rag.retriever import get_active_index
+from backend.app.rag.generations import list_generations
 import traceback # For detailed error logging
 
 router = APIRouter()
@@ -11,28 +20,118 @@ class QueryRequest(BaseModel):
 
 class QueryResponse(BaseModel):
     result: str
+    usage: Optional[dict] = None # What the run used of its time, token and tool call budget (see crew/budget.py)
     # Potentially add status, job_id, etc. for async handling later
 
 @router.post("/process-query", response_model=QueryResponse)
-async def process_legal_query(request: QueryRequest = Body(...)):
+async def process_legal_query(
+    request: QueryRequest = Body(...),
+    x_api_key: Optional[str] = Header(None),
+    x_client_id: Optional[str] = Header(None),
+):
     """
     Receives a client query and initiates the CrewAI legal advisory process.
+    Requests are queued per client (X-API-Key or X-Client-ID header) and served in fair share;
+    when the queue is full the response is 429 with a Retry-After header.
+    Each run is held to the RUN_MAX_* budget; the response reports its usage.
     """
-    print(f"Received query: {request.client_query}, DocType: {request.document_type}")
+    try:
+        client = resolve_client(x_api_key, x_client_id)
+    except ValueError as e:
+        raise HTTPException(status_code=401, detail=str(e))
+    print(f"Received query from client '{client}': {request.client_query}, DocType: {request.document_type}")
     if not request.client_query:
         raise HTTPException(status_code=400, detail="Client query cannot be empty.")
 
     try:
         # In a production system, this should be asynchronous (e.g., using Celery)
-        # For simplicity, running it synchronously here. BEWARE of long request times.
-        final_result = run_crew(
+        # For simplicity, the crew runs in a worker thread for the duration of the request,
+        # which keeps the event loop free so several crews can run at once. BEWARE of long request times.
+        budget = RunBudget()
+        final_result = await crew_scheduler.run(
+            client,
+            request.document_type,
+            run_in_threadpool,
+            run_crew,
             client_query=request.client_query,
-            document_type=request.document_type
+            document_type=request.document_type,
+            budget=budget
         )
-        return QueryResponse(result=final_result)
+        return QueryResponse(result=final_result, usage=budget.usage())
 
+    except CrewRunFailed as e:
+        # The crew's own error message, shown to the user as before; the scheduler does not time failed runs
+        return QueryResponse(result=str(e), usage=budget.usage())
+    except SchedulerRejected as e:
+        raise HTTPException(status_code=429, detail=e.detail, headers={"Retry-After": str(e.retry_after)})
+    except AgentPoolExhausted as e:
+        print(f"Rejected query, all agent sets busy: {e}")
+        raise HTTPException(status_code=503, detail="All legal advisory teams are busy. Please retry shortly.")
     except Exception as e:
         print(f"Error processing query: {e}")
         traceback.print_exc() # Print full traceback to console/logs
         # Provide a more generic error to the client
-        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"An internal error occurred: {str(e)}")
+
+
+# --- Admin: Index Management ---
+
+def require_admin_key(x_admin_key: Optional[str] = Header(None)):
+    """Only lets requests through that carry the configured ADMIN_API_KEY."""
+    if not settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled (ADMIN_API_KEY is not set).")
+    if x_admin_key != settings.ADMIN_API_KEY:
+        raise HTTPException(status_code=401, detail="Invalid or missing X-Admin-Key header.")
+
+class ReindexRequest(BaseModel):
+    # Leave empty to use the embedding model from .env; set both to migrate to another model
+    embedding_model_type: Optional[str] = None
+    embedding_model_name: Optional[str] = None
+    skip_extraction: bool = False # Reuse the page store as-is instead of checking the PDFs for changes
+
+class ActivateRequest(BaseModel):
+    generation: str
+
+@router.post("/admin/reindex", status_code=202, dependencies=[Depends(require_admin_key)])
+async def start_reindex(request: ReindexRequest = Body(default=ReindexRequest())):
+    """
+    Builds a new index generation in the background, validates it and switches queries over to it.
+    Queries keep being served from the current index until the switch; in-flight queries finish on it.
+    """
+    try:
+        return reindex_manager.start(
+            embedding_model_type=request.embedding_model_type,
+            embedding_model_name=request.embedding_model_name,
+            skip_extraction=request.skip_extraction,
+        )
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/admin/index", dependencies=[Depends(require_admin_key)])
+async def get_index_status():
+    """Reports the active index, the available generations and the state of the last rebuild."""
+    active = get_active_index()
+    return {
+        "active": {"generation": active.generation, "path": active.path, **active.meta} if active else None,
+        "generations": list_generations(),
+        "rebuild": reindex_manager.status,
+    }
+
+@router.post("/admin/index/activate", dependencies=[Depends(require_admin_key)])
+async def activate_generation(request: ActivateRequest = Body(...)):
+    """Switches to an existing index generation, e.g. to roll back a bad rebuild."""
+    try:
+        return reindex_manager.activate(request.generation)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+# --- Admin: Scheduling ---
+
+@router.get("/admin/scheduler", dependencies=[Depends(require_admin_key)])
+async def get_scheduler_status():
+    """Reports running and queued crew runs per client, and the run durations the wait estimates are based on."""
+    return crew_scheduler.status()
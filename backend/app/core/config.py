@@ -3,6 +3,11 @@ from dotenv import load_dotenv
 
 load_dotenv() # Load environment variables from .env file
 
+def _parse_mapping(value: str) -> dict:
+    """Parses "a:b,c:d" into {"a": "b", "c": "d"}."""
+    pairs = (item.split(":", 1) for item in (value or "").split(",") if ":" in item)
+    return {key.strip(): val.strip() for key, val in pairs}
+
 class Settings:
     # LLM
     GOOGLE_API_KEY: str = os.getenv("GOOGLE_API_KEY")
@@ -14,14 +19,47 @@ class Settings:
     EMBEDDING_MODEL_TYPE: str = os.getenv("EMBEDDING_MODEL_TYPE", "local") # 'local' or 'google'
     EMBEDDING_MODEL_NAME: str = os.getenv("EMBEDDING_MODEL_NAME", "all-MiniLM-L6-v2") # Or Google model name
     GOOGLE_EMBEDDING_MODEL_NAME: str = os.getenv("GOOGLE_EMBEDDING_MODEL_NAME", "models/text-embedding-004")
+    PAGE_STORE_PATH: str = os.getenv("PAGE_STORE_PATH", "./backend/data/page_store") # Parsed PDF pages, reused across re-indexing runs
+    CHUNK_SIZE: int = int(os.getenv("CHUNK_SIZE", 1000))
+    CHUNK_OVERLAP: int = int(os.getenv("CHUNK_OVERLAP", 200))
+    DEDUP_ENABLED: bool = os.getenv("DEDUP_ENABLED", "true").lower() == "true" # Drop near-duplicate pages/chunks before embedding
+    DEDUP_THRESHOLD: float = float(os.getenv("DEDUP_THRESHOLD", 0.9)) # Estimated Jaccard similarity above which texts count as duplicates
+    HIERARCHICAL_INDEX_ENABLED: bool = os.getenv("HIERARCHICAL_INDEX_ENABLED", "false").lower() == "true" # Build document/article summaries for coarse-to-fine search
+    SUMMARY_BACKEND: str = os.getenv("SUMMARY_BACKEND", "extractive") # 'extractive' (local, no LLM) or 'gemini'
+    HIERARCHY_TOP_DOCUMENTS: int = int(os.getenv("HIERARCHY_TOP_DOCUMENTS", 5)) # Documents picked by their summaries; only their articles and chunks are searched
+    HIERARCHY_TOP_ARTICLES: int = int(os.getenv("HIERARCHY_TOP_ARTICLES", 20)) # Articles of those documents, picked by their summaries, whose chunks are searched
+    INDEX_GENERATIONS_PATH: str = os.getenv("INDEX_GENERATIONS_PATH", "./backend/data/index_generations") # Rebuilt indexes, hot-swapped by the API
+    INDEX_GENERATIONS_KEEP: int = int(os.getenv("INDEX_GENERATIONS_KEEP", 2)) # Inactive generations kept for rollback (at least 1); generations still in use are never deleted
+    PREFETCH_ENABLED: bool = os.getenv("PREFETCH_ENABLED", "true").lower() == "true" # Search for every expert domain while the consultation task runs
+    PREFETCH_SIMILARITY_THRESHOLD: float = float(os.getenv("PREFETCH_SIMILARITY_THRESHOLD", 0.85)) # Query embedding cosine similarity for a cache hit
+    PREFETCH_WAIT_SECONDS: float = float(os.getenv("PREFETCH_WAIT_SECONDS", 2)) # How long a tool search waits for unfinished prefetches
 
 
     # API
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
     API_PORT: int = int(os.getenv("API_PORT", 8000))
+    ADMIN_API_KEY: str = os.getenv("ADMIN_API_KEY") # Required in the X-Admin-Key header of /admin endpoints; unset disables them
 
     # CrewAI
     CREWAI_VERBOSE: int = int(os.getenv("CREWAI_VERBOSE", 2))
+    AGENT_POOL_SIZE: int = int(os.getenv("AGENT_POOL_SIZE", 2)) # Agent sets built at startup = max crews running at once
+    AGENT_POOL_TIMEOUT: float = float(os.getenv("AGENT_POOL_TIMEOUT", 600)) # Seconds a request waits for a free agent set
+
+    # Per-run budget (see crew/budget.py); 0 = unlimited
+    RUN_MAX_SECONDS: float = float(os.getenv("RUN_MAX_SECONDS", 900)) # Wall-clock time of one crew run
+    RUN_MAX_TOKENS: int = int(os.getenv("RUN_MAX_TOKENS", 200000)) # LLM tokens (prompt + completion) of one crew run
+    RUN_MAX_TOOL_CALLS: int = int(os.getenv("RUN_MAX_TOOL_CALLS", 15)) # Knowledge base searches of one crew run (refused searches do not count)
+    RUN_CONTEXT_CHARS: int = int(os.getenv("RUN_CONTEXT_CHARS", 6000)) # Task outputs longer than this are condensed before later tasks read them
+    RUN_BUDGET_FINAL_RESERVE: float = float(os.getenv("RUN_BUDGET_FINAL_RESERVE", 0.2)) # Share of each cap held back for the consolidation task
+
+    # Scheduling (fair share between the clients of /process-query)
+    CLIENT_API_KEYS: dict = _parse_mapping(os.getenv("CLIENT_API_KEYS")) # "key:client,...": X-API-Key values and the client they identify
+    CLIENT_WEIGHTS: dict = {client: float(weight) for client, weight in _parse_mapping(os.getenv("CLIENT_WEIGHTS")).items()} # "client:weight,..."; unlisted clients weigh 1
+    CLIENT_MAX_CONCURRENT: int = int(os.getenv("CLIENT_MAX_CONCURRENT", 0)) # Crews one client may run at once; 0 = up to AGENT_POOL_SIZE
+    CLIENT_MAX_QUEUED: int = int(os.getenv("CLIENT_MAX_QUEUED", 5)) # Waiting requests per client before 429
+    SCHEDULER_MAX_QUEUED: int = int(os.getenv("SCHEDULER_MAX_QUEUED", 20)) # Waiting requests overall before 429
+    SCHEDULER_MAX_WAIT: float = float(os.getenv("SCHEDULER_MAX_WAIT", 1200)) # Estimated queue wait (s) above which requests get 429
+    SCHEDULER_DEFAULT_RUN_SECONDS: float = float(os.getenv("SCHEDULER_DEFAULT_RUN_SECONDS", 180)) # Assumed crew run time until real runs are measured
 
 settings = Settings()
 
@@ -0,0 +1,88 @@
+# backend/app/crew/agent_pool.py
+
+import queue
+import threading
+from contextlib import contextmanager
+
+from backend.app.agents.legal_agents import AgentSet, build_agent_set
+from backend.app.core.config import settings
+
+
+class AgentPoolExhausted(RuntimeError):
+    """Raised when no agent set became free within the acquire timeout."""
+
+
+# Per-run state CrewAI leaves on an Agent. Cleared when a set goes back to the pool so the
+# next run starts from the same state as a freshly built agent.
+_AGENT_RUN_STATE_DEFAULTS = {
+    "crew": None,
+    "tools_results": [],
+    "step_callback": None, # Crew.kickoff only sets these when they are still unset
+    "function_calling_llm": None,
+    "_times_executed": 0,
+    "max_execution_time": None, # Set per task from the run's budget (see crew/budget.py)
+}
+
+
+def reset_agent_set(agent_set: AgentSet):
+    """
+    Clears the state a crew run leaves behind on the agents of a set.
+    Raises if an attribute cannot be cleared; the pool then replaces the set with a fresh one.
+    """
+    for agent in agent_set.agents:
+        for attr, default in _AGENT_RUN_STATE_DEFAULTS.items():
+            if hasattr(agent, attr):
+                setattr(agent, attr, list(default) if isinstance(default, list) else default)
+
+
+class AgentPool:
+    """
+    A fixed number of pre-built, isolated agent sets.
+
+    A crew run borrows one set for its whole duration, so up to `size` crews can run
+    concurrently in one process without sharing any Agent object, and without paying
+    the agent/LLM construction cost on every request.
+    """
+
+    def __init__(self, size: int = None, factory=build_agent_set):
+        self.size = size or settings.AGENT_POOL_SIZE
+        self._factory = factory
+        self._free = queue.LifoQueue() # Reuse the most recently returned (warmest) set first
+        self._in_use = 0
+        self._lock = threading.Lock()
+        print(f"--- Pre-building {self.size} agent set(s) ---")
+        for _ in range(self.size):
+            self._free.put(factory())
+
+    @property
+    def in_use(self) -> int:
+        return self._in_use
+
+    @contextmanager
+    def acquire(self, timeout: float = None):
+        """
+        Borrows an agent set for the duration of the `with` block.
+        Raises AgentPoolExhausted if none becomes free within `timeout` seconds.
+        """
+        timeout = settings.AGENT_POOL_TIMEOUT if timeout is None else timeout
+        try:
+            agent_set = self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise AgentPoolExhausted(f"No free agent set within {timeout}s (pool size {self.size}).")
+        with self._lock:
+            self._in_use += 1
+        try:
+            yield agent_set
+        finally:
+            try:
+                reset_agent_set(agent_set)
+            except Exception as e:
+                # A set that cannot be cleaned must not leak state into the next run
+                print(f"Warning: Could not reset agent set ({e}); replacing it with a fresh one.")
+                agent_set = self._factory()
+            with self._lock:
+                self._in_use -= 1
+            self._free.put(agent_set)
+
+
+agent_pool = AgentPool()
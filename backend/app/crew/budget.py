@@ -0,0 +1,280 @@
+# backend/app/crew/budget.py
+
+import math
+import re
+import threading
+import time
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from backend.app.core.config import settings
+
+# --- Per-Run Budget ---
+# A crew run can spiral: agents repeat tool calls, and every task adds to the context the
+# next ones read. A RunBudget caps the wall-clock time, LLM tokens and tool calls of one run.
+# As usage approaches the caps, the run degrades instead of failing:
+# - long task outputs are condensed before later tasks read them as context
+# - knowledge base searches return fewer chunks, and are refused once the tool calls are spent
+# - an agent over budget gets CrewAI's "give your final answer now" step, and a task that
+#   starts with no time left ends without an LLM call (CrewAI's max_execution_time)
+# Until the consolidation task starts, RUN_BUDGET_FINAL_RESERVE of every cap is held back for
+# it, so the client still gets a document.
+# Tokens are estimated from the text length, unless the LLM reports its usage.
+CHARS_PER_TOKEN = 4
+MIN_RETRIEVAL_K = 2
+MIN_CONTEXT_CHARS = 1500
+CONDENSED_NOTE = "[Condensed to fit the request's processing budget.]"
+TOOL_BUDGET_MESSAGE = (
+    "The search budget for this request is used up. Do not search again; "
+    "give your final answer with the information you already have."
+)
+# A sentence end, not an abbreviation like "Art." or "n.º": followed by a capital letter
+_SENTENCE_END_RE = re.compile(r"[.!?](?=\s+[\"'(A-ZÀ-Ý])")
+
+
+def _estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def condense_text(text: str, max_chars: int) -> str:
+    """Extractive summary of a task output: each paragraph cut to its first sentence, then cut to max_chars (note included)."""
+    if len(text) <= max_chars:
+        return text
+    max_chars = max(max_chars - len(CONDENSED_NOTE) - 1, 0) # Room for the note and the newline before it
+    lines = []
+    for paragraph in text.splitlines():
+        paragraph = re.sub(r"\s+", " ", paragraph).strip()
+        if not paragraph:
+            continue
+        end = next((m.end() for m in _SENTENCE_END_RE.finditer(paragraph) if m.end() >= 40), None)
+        lines.append(paragraph[:end] if end else paragraph)
+    condensed = "\n".join(lines)
+    if len(condensed) > max_chars:
+        cut = condensed.rfind("\n", 0, max_chars)
+        condensed = condensed[:cut if cut > max_chars // 2 else max_chars]
+    return f"{condensed}\n{CONDENSED_NOTE}"
+
+
+class BudgetCallbackHandler(BaseCallbackHandler):
+    """Charges every LLM call of a run to its budget. Attached to the run's LLM for the duration of the run."""
+
+    def __init__(self, budget: "RunBudget"):
+        self.budget = budget
+        self._prompt_tokens = {} # run_id -> estimated prompt tokens of calls in flight
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(_estimate_tokens(prompt) for prompt in prompts)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._prompt_tokens[run_id] = sum(
+            _estimate_tokens(str(message.content)) for batch in messages for message in batch
+        )
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens = self._prompt_tokens.pop(run_id, 0)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("total_tokens"):
+            self.budget.charge_llm_call(usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0), estimated=False)
+            return
+        completion = sum(_estimate_tokens(generation.text) for batch in response.generations for generation in batch)
+        self.budget.charge_llm_call(prompt_tokens, completion)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        # The prompt was sent (and is usually billed) even if no answer came back
+        self.budget.charge_llm_call(self._prompt_tokens.pop(run_id, 0), 0)
+
+
+class RunBudget:
+    """The caps of one crew run and what it has used of them. A cap of 0 means unlimited."""
+
+    def __init__(self, max_seconds: float = None, max_tokens: int = None, max_tool_calls: int = None,
+                 context_chars: int = None, final_reserve: float = None):
+        self.max_seconds = settings.RUN_MAX_SECONDS if max_seconds is None else max_seconds
+        self.max_tokens = settings.RUN_MAX_TOKENS if max_tokens is None else max_tokens
+        self.max_tool_calls = settings.RUN_MAX_TOOL_CALLS if max_tool_calls is None else max_tool_calls
+        self.context_chars = settings.RUN_CONTEXT_CHARS if context_chars is None else context_chars
+        self.final_reserve = settings.RUN_BUDGET_FINAL_RESERVE if final_reserve is None else final_reserve
+        self.started = time.monotonic()
+        self.finished = None
+        self.llm_calls = self.prompt_tokens = self.completion_tokens = 0
+        self.tokens_estimated = False
+        self.tool_calls = self.tool_calls_refused = 0
+        self.final_task = False # Set when the consolidation task starts; it may use the reserve
+        self.degradations = []
+        self._retrieval_k = None
+        self._handler = None
+        self._lock = threading.Lock()
+
+    # --- Accounting ---
+    @property
+    def tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def charge_llm_call(self, prompt_tokens: int, completion_tokens: int, estimated: bool = True):
+        with self._lock:
+            self.llm_calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.completion_tokens += completion_tokens
+            self.tokens_estimated = self.tokens_estimated or estimated
+
+    def charge_tool_call(self):
+        """Charged by the search tool for every search it runs; refused calls only count in tool_calls_refused."""
+        with self._lock:
+            self.tool_calls += 1
+
+    def _degrade(self, note: str):
+        with self._lock:
+            self.degradations.append(note)
+        print(f"Run budget: {note}")
+
+    # --- Limits ---
+    def _cap(self, limit: float) -> float:
+        """What the current task may use up to: the whole cap for the consolidation task, the cap minus the reserve before it."""
+        return limit if self.final_task else limit * (1 - self.final_reserve)
+
+    def pressure(self) -> float:
+        """The largest share of a cap used so far (0 = nothing used, 1 = a cap reached)."""
+        used = [(self.elapsed, self.max_seconds), (self.tokens, self.max_tokens), (self.tool_calls, self.max_tool_calls)]
+        return max([value / limit for value, limit in used if limit] or [0.0])
+
+    def exceeded(self) -> str | None:
+        """Which budget the current task has run out of, if any."""
+        if self.max_seconds and self.elapsed >= self._cap(self.max_seconds):
+            return "time"
+        if self.max_tokens and self.tokens >= self._cap(self.max_tokens):
+            return "tokens"
+        if self.max_tool_calls and self.tool_calls >= self._cap(self.max_tool_calls):
+            return "tool calls"
+        return None
+
+    def remaining_seconds(self) -> int | None:
+        """Seconds left for the current task (None if unlimited), for CrewAI's max_execution_time."""
+        if not self.max_seconds:
+            return None
+        remaining = math.floor(self._cap(self.max_seconds) - self.elapsed)
+        # 0 ends a task before its first LLM call; the consolidation task always gets one
+        return max(remaining, 1) if self.final_task else max(remaining, 0)
+
+    # --- Degradation ---
+    def retrieval_k(self, k: int) -> int:
+        """Number of chunks a search returns: k up to half the budget, then down to MIN_RETRIEVAL_K."""
+        pressure = self.pressure()
+        reduced = k if pressure < 0.5 else max(MIN_RETRIEVAL_K, min(k, math.ceil(k * 2 * (1 - pressure))))
+        if reduced < k and reduced != self._retrieval_k:
+            self._degrade(f"searches return {reduced} instead of {k} chunks")
+        self._retrieval_k = reduced
+        return reduced
+
+    def refuse_tool_call(self) -> str | None:
+        """The message a tool returns instead of running once the tool calls are spent, else None."""
+        if not self.max_tool_calls or self.tool_calls < self._cap(self.max_tool_calls):
+            return None
+        with self._lock:
+            self.tool_calls_refused += 1
+            first = self.tool_calls_refused == 1
+        if first:
+            self._degrade("tool call budget used up; further searches are refused")
+        return TOOL_BUDGET_MESSAGE
+
+    def context_limit(self) -> int | None:
+        """Max characters of a task output that later tasks read: RUN_CONTEXT_CHARS, shrinking past half the budget."""
+        if not self.context_chars:
+            return None
+        pressure = self.pressure()
+        if pressure < 0.5:
+            return self.context_chars
+        return max(MIN_CONTEXT_CHARS, int(self.context_chars * 2 * (1 - pressure)))
+
+    def condense_output(self, task_output):
+        """Condenses a finished task's output in place, so the tasks that read it as context get the short version."""
+        limit = self.context_limit()
+        text = task_output.raw_output or ""
+        if limit is None or len(text) <= limit:
+            return
+        task_output.raw_output = condense_text(text, limit)
+        self._degrade(f"output of {task_output.agent} condensed from {len(text)} to {len(task_output.raw_output)} characters")
+
+    # --- Wiring into a crew run ---
+    def _apply_time_limit(self, agents):
+        seconds = self.remaining_seconds()
+        for agent in agents.agents:
+            agent.max_execution_time = seconds # Read when the agent creates the executor for its next task
+
+    def _step_callback(self, agent):
+        def on_step(step_output):
+            if not isinstance(step_output, list):
+                return # An AgentFinish ends the task anyway
+            reason = self.exceeded()
+            executor = agent.agent_executor
+            if reason and executor is not None and not executor.have_forced_answer:
+                # CrewAI replaces the next step with "give your final answer now"
+                executor.force_answer_max_iterations = executor.iterations + 1
+                self._degrade(f"{agent.role} told to give its final answer early (out of {reason})")
+        return on_step
+
+    def _task_callback(self, agents, condense: bool, final_next: bool):
+        def on_task_done(task_output):
+            if condense:
+                self.condense_output(task_output)
+            if final_next:
+                self.final_task = True
+            self._apply_time_limit(agents)
+            if self.max_seconds and self.remaining_seconds() == 0:
+                self._degrade(f"time budget used up after the task of {task_output.agent}; the next expert tasks are skipped")
+        return on_task_done
+
+    def attach(self, agents, tasks: list):
+        """
+        Enforces the budget on a crew run: on the agents and LLM of the run's agent set, and
+        through callbacks on its tasks (in execution order; the last one is the consolidation).
+        """
+        self.started = time.monotonic() # Time spent queueing for an agent set does not count
+        self._handler = BudgetCallbackHandler(self)
+        if not isinstance(agents.llm.callbacks, list):
+            agents.llm.callbacks = []
+        agents.llm.callbacks.append(self._handler)
+        for agent in agents.agents:
+            agent.step_callback = self._step_callback(agent)
+        for i, task in enumerate(tasks):
+            final = i == len(tasks) - 1
+            task.callback = self._task_callback(agents, condense=not final, final_next=i == len(tasks) - 2)
+        self.final_task = len(tasks) == 1
+        self._apply_time_limit(agents)
+        agents.search_tool.budget = self
+
+    def detach(self, agents):
+        """Removes the budget from the agent set again (the agent pool resets the rest)."""
+        self.finished = time.monotonic()
+        if self._handler in (agents.llm.callbacks or []):
+            agents.llm.callbacks.remove(self._handler)
+        agents.search_tool.budget = None
+        print(f"Run budget: {self.summary()}")
+
+    # --- Reporting ---
+    def summary(self) -> str:
+        tokens = f"~{self.tokens}" if self.tokens_estimated else str(self.tokens)
+        return (f"{self.elapsed:.0f}s of {self.max_seconds or 'unlimited'}, "
+                f"{tokens} tokens of {self.max_tokens or 'unlimited'} in {self.llm_calls} LLM calls, "
+                f"{self.tool_calls} tool calls of {self.max_tool_calls or 'unlimited'}, "
+                f"{len(self.degradations)} degradation(s)")
+
+    def usage(self) -> dict:
+        """The run's usage against its caps, for the API response."""
+        return {
+            "elapsed_seconds": round(self.elapsed, 1),
+            "max_seconds": self.max_seconds or None,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.tokens,
+            "tokens_estimated": self.tokens_estimated,
+            "max_tokens": self.max_tokens or None,
+            "tool_calls": self.tool_calls,
+            "tool_calls_refused": self.tool_calls_refused,
+            "max_tool_calls": self.max_tool_calls or None,
+            "degradations": list(self.degradations),
+        }
@@ -2,13 +2,9 @@
 
 from crewai import Crew, Process
 # Import Agents
-from backend.app.agents.legal_agents import (
-    legal_advisor,
-    labour_law_expert,
-    civil_law_expert,
-    fiscal_law_expert
-    # legal_drafter import removed
-)
+from backend.app.agents.legal_agents import AgentSet
+from backend.app.crew.agent_pool import agent_pool
+from backend.app.crew.budget import RunBudget
 # Import Task creators
 from backend.app.tasks.legal_tasks import (
     create_client_consultation_task,
@@ -19,15 +15,23 @@ from backend.app.tasks.legal_tasks import (
     create_final_consolidation_task # Added for the new final task
 )
 from backend.app.core.config import settings
+from backend.app.rag.retriever import get_document_template
+from backend.app.rag.prefetch import start_prefetch
+from backend.app.rag.templates import format_template_for_prompt
 import traceback # For error logging
 
-def create_legal_crew(client_query: str, document_type: str):
+
+class CrewRunFailed(RuntimeError):
+    """Raised when the crew fails; the message is meant for the user."""
+
+def create_legal_crew(client_query: str, document_type: str, agents: AgentSet):
     """
     Creates and configures the legal advisory crew.
 
     Args:
         client_query: The initial query from the user.
         document_type: The desired output document type (e.g., "Legal Opinion").
+        agents: The agent set this crew runs with; must not be used by another crew at the same time.
 
     Returns:
         A configured Crew instance.
@@ -35,11 +39,11 @@ def create_legal_crew(client_query: str, document_type: str):
     print(f"--- Creating Legal Crew for Query: '{client_query[:70]}...' ---") # Log query
     # 1. Create Tasks
     print("Instantiating tasks...")
-    consultation_task = create_client_consultation_task()
-    labour_analysis_task = create_labour_law_analysis_task()
-    civil_analysis_task = create_civil_law_analysis_task()
-    fiscal_analysis_task = create_fiscal_law_analysis_task()
-    consolidation_task = create_final_consolidation_task() # New final task
+    consultation_task = create_client_consultation_task(agents.legal_advisor)
+    labour_analysis_task = create_labour_law_analysis_task(agents.labour_law_expert)
+    civil_analysis_task = create_civil_law_analysis_task(agents.civil_law_expert)
+    fiscal_analysis_task = create_fiscal_law_analysis_task(agents.fiscal_law_expert)
+    consolidation_task = create_final_consolidation_task(agents.legal_advisor) # New final task
     print("Tasks instantiated.")
 
     # Define the sequence of tasks
@@ -54,32 +58,25 @@ def create_legal_crew(client_query: str, document_type: str):
     # Define the agents involved in this crew
     # Note: Even if an agent only performs one task, they need to be in the agents list.
     # The Lead Legal Advisor performs the first and last tasks.
-    current_agents = [
-        legal_advisor,
-        labour_law_expert,
-        civil_law_expert,
-        fiscal_law_expert,
-    ]
+    current_agents = agents.agents
 
     # 2. Define Task Dependencies (Context Passing)
-    # For Process.sequential, context is usually passed implicitly.
-    # Explicit context can be set if specific outputs from non-adjacent tasks are needed.
-    # For this linear flow, explicit context for each step is generally not required
-    # as CrewAI handles passing the output of task N as context to task N+1.
+    # For Process.sequential, CrewAI passes the output of task N as context to task N+1 unless a
+    # task lists its context explicitly. The experts only need the Lead Legal Advisor's plan, not
+    # the previous expert's analysis, and the consolidation needs every analysis. Reading outputs
+    # through task.context also means they get the condensed versions when the run budget is
+    # tight (see crew/budget.py).
     # The placeholders in task descriptions (e.g., {client_query}) will be filled
-    # from the initial 'inputs' to crew.kickoff() or from the context of previous tasks.
-
-    # Example of explicit context setting (if needed for specific versions/flows):
-    # labour_analysis_task.context = [consultation_task]
-    # civil_analysis_task.context = [consultation_task]
-    # fiscal_analysis_task.context = [consultation_task]
-    # consolidation_task.context = [
-    #     consultation_task, # For initial query & summary
-    #     labour_analysis_task,
-    #     civil_analysis_task,
-    #     fiscal_analysis_task
-    # ]
-    # print("Task contexts (if explicit) are notionally set.")
+    # from the initial 'inputs' to crew.kickoff().
+    labour_analysis_task.context = [consultation_task]
+    civil_analysis_task.context = [consultation_task]
+    fiscal_analysis_task.context = [consultation_task]
+    consolidation_task.context = [
+        consultation_task, # For initial query & summary
+        labour_analysis_task,
+        civil_analysis_task,
+        fiscal_analysis_task
+    ]
 
 
     # 3. Instantiate the Crew
@@ -95,30 +92,50 @@ def create_legal_crew(client_query: str, document_type: str):
     print("Crew instantiated.")
     return legal_crew
 
-def run_crew(client_query: str, document_type: str = "Legal Opinion") -> str:
+def run_crew(client_query: str, document_type: str = "Legal Opinion", budget: RunBudget = None) -> str:
     """
     Initializes and runs the legal crew.
-    """
-    crew = create_legal_crew(client_query, document_type)
 
+    Safe to call from several threads at once: each run borrows its own agent set from the
+    pool (waiting for one to become free if necessary; raises AgentPoolExhausted on timeout).
+    The run is held to `budget` (a RunBudget from the settings if not given); read its usage()
+    afterwards to see what the run consumed.
+    Raises CrewRunFailed if the crew fails, so callers can tell a failed run from a finished one.
+    """
+    budget = budget or RunBudget()
     # Inputs for the kickoff method. These are primarily used by the first task(s)
     # or any task that explicitly uses these top-level input keys in its description.
     inputs = {
         "client_query": client_query,
-        "document_type": document_type
+        "document_type": document_type,
+        # Looked up by document type, so the consolidation task needs no search to find its structure
+        "document_template": format_template_for_prompt(get_document_template(document_type)),
     }
 
-    print(f"--- Kicking off Crew for Query: '{client_query[:70]}...' ---")
-    try:
-        result = crew.kickoff(inputs=inputs)
-        print(f"--- Crew execution finished for Query: '{client_query[:70]}...' ---")
-        if not result:
-             print("Warning: Crew execution resulted in an empty or None result.")
+    with agent_pool.acquire() as agents:
+        # Search every expert domain in the background while the consultation task runs;
+        # the experts' tool calls are then served from this run's cache where possible
+        retrieval_cache = start_prefetch(client_query)
+        agents.search_tool.retrieval_cache = retrieval_cache
+        crew = create_legal_crew(client_query, document_type, agents)
+
+        print(f"--- Kicking off Crew for Query: '{client_query[:70]}...' ---")
+        try:
+            budget.attach(agents, crew.tasks)
+            result = crew.kickoff(inputs=inputs)
+            print(f"--- Crew execution finished for Query: '{client_query[:70]}...' ---")
+            if not result:
+                 print("Warning: Crew execution resulted in an empty or None result.")
+                 # Provide a more user-friendly message for the frontend
+                 return "The legal advisory crew processed the request but did not produce a final consolidated output. Please check the logs or try refining the query."
+            return result
+        except Exception as e:
+             print(f"!!! ERROR during crew kickoff/execution: {e} !!!")
+             traceback.print_exc() # Log full traceback for debugging
              # Provide a more user-friendly message for the frontend
-             return "The legal advisory crew processed the request but did not produce a final consolidated output. Please check the logs or try refining the query."
-        return result
-    except Exception as e:
-         print(f"!!! ERROR during crew kickoff/execution: {e} !!!")
-         traceback.print_exc() # Log full traceback for debugging
-         # Provide a more user-friendly message for the frontend
-         return f"An error occurred during the legal analysis process. Details: {str(e)[:200]}" # Truncate long errors
\ No newline at end of file
+             raise CrewRunFailed(f"An error occurred during the legal analysis process. Details: {str(e)[:200]}") from e # Truncate long errors
+        finally:
+            budget.detach(agents)
+            agents.search_tool.retrieval_cache = None
+            if retrieval_cache:
+                retrieval_cache.close()
\ No newline at end of file
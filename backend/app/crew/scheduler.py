@@ -0,0 +1,292 @@
+# backend/app/crew/scheduler.py
+
+import asyncio
+import math
+import time
+from collections import deque
+
+from backend.app.core.config import settings
+from backend.app.rag.templates import KNOWN_DOCUMENT_TYPES, normalize_document_type
+
+# --- Fair-Share Crew Scheduler ---
+# Every /process-query request waits in a queue for the client that sent it. When a crew
+# slot (one agent set of the pool) frees up, the next run goes to the client that has had
+# the least weighted service so far (start-time fair queueing). A client's virtual time
+# advances by the expected duration of each run it starts divided by its weight, so one
+# team's burst of long Legal Opinions cannot starve a team asking a single short question.
+# Expected durations are a moving average of measured runs per document type. The same
+# figures drive the wait estimate used for admission control.
+EWMA_ALPHA = 0.3 # Weight of the newest run in the duration averages
+DEFAULT_CLIENT = "default"
+MAX_CLIENT_ID_LENGTH = 64
+
+
+class SchedulerRejected(Exception):
+    """Raised when a request is not admitted. retry_after is the suggested wait in whole seconds."""
+
+    def __init__(self, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.detail = detail
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+def resolve_client(api_key: str = None, client_id: str = None) -> str:
+    """
+    Identifies who sent a request: the client an X-API-Key maps to in CLIENT_API_KEYS,
+    else 'default'. The self-declared X-Client-ID header is only used while no CLIENT_API_KEYS
+    are configured: a sender could change it on every request to get around the per-client limits.
+    Raises ValueError for an unknown key.
+    """
+    if api_key:
+        if api_key not in settings.CLIENT_API_KEYS:
+            raise ValueError("Unknown X-API-Key.")
+        return settings.CLIENT_API_KEYS[api_key]
+    if settings.CLIENT_API_KEYS or not client_id:
+        return DEFAULT_CLIENT
+    return client_id.strip()[:MAX_CLIENT_ID_LENGTH] or DEFAULT_CLIENT
+
+
+def document_cost_key(document_type: str) -> str | None:
+    """
+    Duration estimate key of a requested document type: its name if the app knows the type,
+    else None (the average of all runs), so free-text types cannot grow the estimates.
+    """
+    return KNOWN_DOCUMENT_TYPES.get(normalize_document_type(document_type))
+
+
+class RunDurationEstimator:
+    """Exponentially weighted moving average of crew run durations, per document type and overall."""
+
+    def __init__(self, default_seconds: float = None, alpha: float = EWMA_ALPHA):
+        self._default = default_seconds or settings.SCHEDULER_DEFAULT_RUN_SECONDS
+        self._alpha = alpha
+        self._averages = {} # document type (None = all runs) -> seconds
+
+    def estimate(self, key: str = None) -> float:
+        return self._averages.get(key, self._averages.get(None, self._default))
+
+    def record(self, key: str, seconds: float):
+        for average_key in {key, None}:
+            previous = self._averages.get(average_key)
+            self._averages[average_key] = seconds if previous is None else (
+                self._alpha * seconds + (1 - self._alpha) * previous
+            )
+
+    def snapshot(self) -> dict:
+        return {key or "*": round(seconds, 1) for key, seconds in self._averages.items()}
+
+
+class _Ticket:
+    """One request: queued until the scheduler grants it a slot by resolving its future."""
+
+    def __init__(self, future: asyncio.Future, cost_key: str, estimate: float):
+        self.future = future
+        self.cost_key = cost_key
+        self.estimate = estimate
+        self.enqueued_at = time.monotonic()
+        self.started_at = None
+
+
+class _ClientState:
+    def __init__(self, name: str, weight: float):
+        self.name = name
+        self.weight = weight
+        self.queue = deque()
+        self.running = set()
+        self.virtual_time = 0.0
+
+
+class CrewScheduler:
+    """
+    Admits, queues and orders crew runs across clients. Lives on the API event loop;
+    all bookkeeping happens there, so no locks are needed.
+    """
+
+    def __init__(self, slots: int = None):
+        self.slots = slots or settings.AGENT_POOL_SIZE
+        self.durations = RunDurationEstimator()
+        self._clients = {}
+        self._running = set()
+        self._virtual_clock = 0.0 # Virtual start time of the most recently started run
+        self.completed = 0
+        self.rejected = 0
+
+    # --- Bookkeeping ---
+    @staticmethod
+    def _weight(name: str) -> float:
+        weight = settings.CLIENT_WEIGHTS.get(name, 1.0)
+        return weight if weight > 0 else 1.0
+
+    def _client(self, name: str) -> _ClientState:
+        if name not in self._clients:
+            self._clients[name] = _ClientState(name, self._weight(name))
+        return self._clients[name]
+
+    def _max_concurrent(self) -> int:
+        return min(settings.CLIENT_MAX_CONCURRENT or self.slots, self.slots)
+
+    def _remaining(self, ticket: _Ticket, now: float) -> float:
+        """Expected seconds until a running ticket finishes (at least a second while it is still running)."""
+        return max(ticket.estimate - (now - ticket.started_at), 1.0)
+
+    def _forget_idle_clients(self):
+        # Idle clients without unpaid service are dropped; they rejoin at the current virtual time anyway.
+        # Once nothing runs or waits, nobody is owed service any more and every idle client is dropped.
+        busy = self._running or self.queued
+        for name, client in list(self._clients.items()):
+            if not client.queue and not client.running and (not busy or client.virtual_time <= self._virtual_clock):
+                del self._clients[name]
+
+    @property
+    def queued(self) -> int:
+        return sum(len(client.queue) for client in self._clients.values())
+
+    # --- Wait Estimate ---
+    def estimate_wait(self, client_name: str, cost_key: str = None, position: int = None) -> float:
+        """
+        Estimated seconds until a request of client_name would start, if it joined the
+        client's queue at `position` (default: the end).
+
+        Before it starts, the runs in flight must free up slots, the client's own requests
+        ahead of it must run, and every other client gets its weighted share of service in
+        the meantime (at most its queued work).
+        """
+        client = self._clients.get(client_name) or _ClientState(client_name, self._weight(client_name))
+        now = time.monotonic()
+        queue = list(client.queue)[:len(client.queue) if position is None else position]
+        own_ahead = sum(ticket.estimate for ticket in queue)
+        own_share = own_ahead + self.durations.estimate(cost_key)
+
+        others_ahead, others_startable = 0.0, False
+        for other in self._clients.values():
+            if other is not client and other.queue:
+                backlog = sum(ticket.estimate for ticket in other.queue)
+                others_ahead += min(backlog, own_share * other.weight / client.weight)
+                others_startable |= len(other.running) < self._max_concurrent()
+
+        if len(self._running) < self.slots and not own_ahead and not others_startable:
+            wait = 0.0 # A slot is free and nobody who could take it is waiting
+        else:
+            running_left = sum(self._remaining(ticket, now) for ticket in self._running)
+            wait = (running_left + own_ahead + others_ahead) / self.slots
+
+        # With the per-client limit reached, the client's own runs have to finish first
+        if len(client.running) + len(queue) >= self._max_concurrent():
+            own_running = sorted(self._remaining(ticket, now) for ticket in client.running)
+            if own_running:
+                wait = max(wait, own_running[0])
+        return wait
+
+    # --- Admission and Dispatch ---
+    def _admit(self, client: _ClientState, cost_key: str) -> float:
+        """Returns the estimated wait of a new request, or raises SchedulerRejected."""
+        wait = self.estimate_wait(client.name, cost_key)
+        if len(client.queue) >= settings.CLIENT_MAX_QUEUED:
+            # A place frees up when the client's oldest queued request starts
+            reason = f"Client '{client.name}' already has {len(client.queue)} requests waiting."
+            retry_after = self.estimate_wait(client.name, cost_key, position=0)
+        elif self.queued >= settings.SCHEDULER_MAX_QUEUED:
+            now = time.monotonic()
+            reason = f"The queue is full ({self.queued} requests waiting)."
+            retry_after = min((self._remaining(ticket, now) for ticket in self._running), default=1.0)
+        elif wait > settings.SCHEDULER_MAX_WAIT:
+            reason = f"The estimated wait of {wait:.0f}s exceeds the limit of {settings.SCHEDULER_MAX_WAIT:.0f}s."
+            retry_after = wait - settings.SCHEDULER_MAX_WAIT
+        else:
+            return wait
+        self.rejected += 1
+        print(f"Scheduler: rejected request of client '{client.name}': {reason}")
+        raise SchedulerRejected(reason, retry_after)
+
+    def _dispatch(self):
+        """Starts queued requests while slots are free, always serving the client with the lowest virtual time."""
+        max_concurrent = self._max_concurrent()
+        while len(self._running) < self.slots:
+            eligible = [c for c in self._clients.values() if c.queue and len(c.running) < max_concurrent]
+            if not eligible:
+                return
+            client = min(eligible, key=lambda c: (c.virtual_time, c.queue[0].enqueued_at))
+            ticket = client.queue.popleft()
+            self._virtual_clock = max(self._virtual_clock, client.virtual_time)
+            client.virtual_time += ticket.estimate / client.weight
+            ticket.started_at = time.monotonic()
+            client.running.add(ticket)
+            self._running.add(ticket)
+            print(f"Scheduler: starting run for client '{client.name}' after "
+                  f"{ticket.started_at - ticket.enqueued_at:.1f}s in queue "
+                  f"({len(self._running)}/{self.slots} slots busy, {self.queued} waiting).")
+            ticket.future.set_result(None)
+
+    def _finish(self, client: _ClientState, ticket: _Ticket, work: asyncio.Future):
+        self._running.discard(ticket)
+        client.running.discard(ticket)
+        if not work.cancelled() and work.exception() is None:
+            # Failed runs (run_crew raises CrewRunFailed) end early and would drag the estimates down
+            self.durations.record(ticket.cost_key, time.monotonic() - ticket.started_at)
+            self.completed += 1
+        self._dispatch()
+        self._forget_idle_clients()
+
+    async def run(self, client_name: str, document_type: str, func, *args, **kwargs):
+        """
+        Waits for this client's turn, then awaits func(*args, **kwargs) and returns its result.
+        The requested document type selects the duration estimate used for fair sharing.
+        Raises SchedulerRejected if the request is not admitted.
+        """
+        client = self._client(client_name)
+        cost_key = document_cost_key(document_type)
+        try:
+            wait = self._admit(client, cost_key)
+        except SchedulerRejected:
+            self._forget_idle_clients()
+            raise
+        if not client.queue and not client.running:
+            # A client returning from idle starts at the current virtual time, without banked credit
+            client.virtual_time = max(client.virtual_time, self._virtual_clock)
+
+        ticket = _Ticket(asyncio.get_running_loop().create_future(), cost_key, self.durations.estimate(cost_key))
+        client.queue.append(ticket)
+        if wait:
+            print(f"Scheduler: queued request of client '{client.name}', estimated wait {wait:.0f}s.")
+        self._dispatch()
+
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            if ticket in client.queue: # Gave up while waiting
+                client.queue.remove(ticket)
+                self._forget_idle_clients()
+            elif ticket in self._running: # Cancelled right after being granted a slot
+                self._running.discard(ticket)
+                client.running.discard(ticket)
+                self._dispatch()
+                self._forget_idle_clients()
+            raise
+
+        # The slot is held until the work itself ends, even if the caller stops waiting for it
+        # (a crew running in a worker thread cannot be interrupted)
+        work = asyncio.ensure_future(func(*args, **kwargs))
+        work.add_done_callback(lambda done: self._finish(client, ticket, done))
+        return await asyncio.shield(work)
+
+    def status(self) -> dict:
+        return {
+            "slots": self.slots,
+            "running": len(self._running),
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "run_seconds_estimates": self.durations.snapshot(),
+            "clients": {
+                name: {
+                    "weight": client.weight,
+                    "running": len(client.running),
+                    "queued": len(client.queue),
+                    "estimated_wait_seconds": round(self.estimate_wait(name)),
+                }
+                for name, client in sorted(self._clients.items())
+            },
+        }
+
+
+crew_scheduler = CrewScheduler()
@@ -0,0 +1,267 @@
+# backend/app/rag/benchmark.py
+
+import ctypes
+import gc
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+import unicodedata
+from datetime import datetime, timezone
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.rag import retriever
+from backend.app.rag.dedup import DUPLICATE_SOURCES_KEY, minhash_signature
+from backend.app.rag.generations import generation_path, read_generation_meta
+from backend.app.rag.hierarchy import extractive_summarizer
+from backend.app.rag.page_store import IDENTICAL_COPIES_KEY
+from backend.app.rag.indexer import build_vector_index
+
+# --- Retrieval Benchmark ---
+# Measures retrieval quality (recall@k, MRR) against a versioned golden set of legal
+# questions, plus query latency, index build time and index size on disk and in memory. Results are plain
+# JSON with a fixed layout so two runs (e.g. before/after a splitter change) can be diffed.
+GOLDEN_SET_PATH = os.path.join(os.path.dirname(settings.LEGAL_DOCS_PATH.rstrip("/")), "benchmark", "golden_set_v2.json")
+RESULTS_FORMAT_VERSION = 1
+
+
+def load_golden_set(path: str = None) -> dict:
+    with open(path or GOLDEN_SET_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _normalize_source(source: str) -> str:
+    """
+    Indexed 'source' path made relative to LEGAL_DOCS_PATH, like the golden set paths, and
+    NFC-normalized (some file names on disk use decomposed accents).
+    """
+    relative = os.path.relpath(os.path.abspath(source), os.path.abspath(settings.LEGAL_DOCS_PATH))
+    if not relative.startswith(".."):
+        source = relative
+    return unicodedata.normalize("NFC", source.replace(os.sep, "/"))
+
+
+def _result_locations(doc) -> set:
+    """(source, page) pairs a retrieved chunk stands for, including identical PDFs and near-duplicates collapsed into it."""
+    locations = {(_normalize_source(doc.metadata.get("source", "")), doc.metadata.get("page"))}
+    for path in json.loads(doc.metadata.get(IDENTICAL_COPIES_KEY, "[]")):
+        locations.add((_normalize_source(path), doc.metadata.get("page")))
+    for label in json.loads(doc.metadata.get(DUPLICATE_SOURCES_KEY, "[]")):
+        source, _, page = label.rpartition("#page=")
+        locations.add((_normalize_source(source), int(page) if page.isdigit() else None))
+    return locations
+
+
+def score_query(results: list, expected: list) -> dict:
+    """
+    Scores one query's ranked results against its expected sources.
+
+    An expected entry is {"source": ..., "pages": [...]}; an empty page list accepts any page of the file.
+    Returns recall (share of expected entries found in the results) and the reciprocal rank
+    of the first relevant result.
+    """
+    targets = [(unicodedata.normalize("NFC", e["source"]), set(e.get("pages") or [])) for e in expected]
+    found, first_rank = set(), None
+    for rank, doc in enumerate(results, start=1):
+        locations = _result_locations(doc)
+        for i, (source, pages) in enumerate(targets):
+            if any(loc_source == source and (not pages or loc_page in pages) for loc_source, loc_page in locations):
+                found.add(i)
+                if first_rank is None:
+                    first_rank = rank
+    return {
+        "recall": len(found) / len(targets) if targets else 0.0,
+        "reciprocal_rank": 1.0 / first_rank if first_rank else 0.0,
+        "first_relevant_rank": first_rank,
+    }
+
+
+def topk_redundancy(results: list, threshold: float = None) -> float:
+    """
+    Share of the results that are near-duplicates (estimated Jaccard >= threshold) of a
+    higher-ranked result, i.e. top-k slots spent on text the agent already got.
+    Compare runs with DEDUP_ENABLED on and off to see how much deduplication frees up.
+    """
+    threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+    signatures, redundant = [], 0
+    for doc in results:
+        signature = minhash_signature(doc.page_content)
+        if signature is not None and any(np.mean(signature == seen) >= threshold for seen in signatures):
+            redundant += 1
+        if signature is not None:
+            signatures.append(signature)
+    return redundant / len(results) if results else 0.0
+
+
+def _percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+    return ordered[rank - 1]
+
+
+def _git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+try:
+    _libc = ctypes.CDLL("libc.so.6")
+except OSError:
+    _libc = None # Not glibc
+
+
+def _current_rss_bytes() -> int | None:
+    """Resident memory of the process right now (VmRSS), or None where /proc is not available."""
+    gc.collect()
+    if _libc is not None:
+        # Hand freed heap back to the OS first; otherwise memory freed by the build is reused unseen
+        _libc.malloc_trim(0)
+    try:
+        with open("/proc/self/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024 # Reported in kB
+    except OSError:
+        pass
+    return None
+
+
+def run_benchmark(k: int = 5, embedding_model_name: str = None, generation: str = None,
+                  golden_set_path: str = None, skip_extraction: bool = False, repeats: int = 3) -> dict:
+    """
+    Runs the golden set against a retrieval index and returns the results as a dict.
+
+    By default a fresh index is built in a temporary directory with the local SentenceTransformer
+    backend, using the current chunking/dedup/hierarchy settings, so the run is offline and
+    measures build time too. Hierarchy summaries are always extractive here, whatever
+    SUMMARY_BACKEND says, so no Gemini calls are made. Pass generation to benchmark an existing
+    (locally embedded) index generation instead.
+    Each query is timed `repeats` times (after one warm-up query) for the latency percentiles.
+    """
+    golden_set = load_golden_set(golden_set_path)
+    model_name = embedding_model_name or settings.EMBEDDING_MODEL_NAME
+    build_stats, temp_dir, index_path, index = None, None, None, None
+    meta = {"embedding_model_type": "local", "embedding_model_name": model_name}
+
+    if generation:
+        index_path = generation_path(generation)
+        meta = read_generation_meta(generation)
+        if meta.get("embedding_model_type") != "local":
+            raise ValueError(f"Generation '{generation}' was not built with local embeddings; it cannot be benchmarked offline.")
+        model_name = meta["embedding_model_name"]
+
+    try:
+        if index_path is None:
+            temp_dir = tempfile.mkdtemp(prefix="malas-benchmark-")
+            index_path = temp_dir
+            embedding_function = retriever.get_cached_embedding_function("local", model_name)
+            print(f"Building benchmark index with local model '{model_name}'...")
+            build_stats = build_vector_index(index_path, embedding_function, skip_extraction, extractive_summarizer)
+            if not build_stats["chunks"]:
+                raise RuntimeError("No chunks were indexed; is the page store empty?")
+            meta["hierarchical"] = bool(build_stats.get("summaries"))
+            # The build leaves its ChromaDB system (with the index loaded) cached for the path
+            retriever.stop_client_system(index_path)
+
+        # Index memory: resident memory added by opening the index and answering the first query.
+        # The embedding model is loaded and run once beforehand so it is not counted.
+        warm_up_query = golden_set["queries"][0]["query"]
+        retriever.get_cached_embedding_function("local", model_name).embed_query(warm_up_query)
+        rss_before = _current_rss_bytes()
+        index = retriever.open_index(index_path, meta=meta)
+        retriever.search_documents(warm_up_query, k, index)
+        rss_after = _current_rss_bytes()
+
+        per_query, latencies = [], []
+        for item in golden_set["queries"]:
+            timings = []
+            for _ in range(max(repeats, 1)):
+                started = time.perf_counter()
+                results = retriever.search_documents(item["query"], k, index)
+                timings.append(time.perf_counter() - started)
+            latencies.extend(timings)
+            score = score_query(results, item["expected"])
+            per_query.append({
+                "id": item["id"],
+                "domain": item["domain"],
+                **score,
+                "redundancy": topk_redundancy(results),
+                "latency_ms": round(1000 * statistics.median(timings), 2),
+                "retrieved": [[_normalize_source(d.metadata.get("source", "")), d.metadata.get("page")] for d in results],
+            })
+
+        by_domain = {}
+        for row in per_query:
+            by_domain.setdefault(row["domain"], []).append(row)
+
+        def summarize(rows: list) -> dict:
+            return {
+                "queries": len(rows),
+                f"recall@{k}": round(statistics.mean(r["recall"] for r in rows), 4),
+                "mrr": round(statistics.mean(r["reciprocal_rank"] for r in rows), 4),
+                f"redundancy@{k}": round(statistics.mean(r["redundancy"] for r in rows), 4),
+            }
+
+        stored_chunks = index.vector_store._collection.count()
+        return {
+            "format_version": RESULTS_FORMAT_VERSION,
+            "golden_set_version": golden_set["version"],
+            "commit": _git_commit(),
+            "run_at": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                "k": k,
+                "embedding_model_name": model_name,
+                "chunk_size": settings.CHUNK_SIZE,
+                "chunk_overlap": settings.CHUNK_OVERLAP,
+                "dedup_enabled": settings.DEDUP_ENABLED,
+                "dedup_threshold": settings.DEDUP_THRESHOLD,
+                "hierarchical": bool(meta.get("hierarchical")),
+                "generation": generation,
+            },
+            "quality": {**summarize(per_query), "by_domain": {d: summarize(rows) for d, rows in sorted(by_domain.items())}},
+            "latency_ms": {
+                "p50": round(1000 * _percentile(latencies, 50), 2),
+                "p99": round(1000 * _percentile(latencies, 99), 2),
+                "mean": round(1000 * statistics.mean(latencies), 2),
+            },
+            "index": {
+                "chunks": stored_chunks,
+                "build_seconds": build_stats["build_seconds"] if build_stats else None,
+                "embedding_seconds": build_stats.get("embedding_seconds") if build_stats else None,
+                "disk_bytes": sum(
+                    os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(index_path) for name in files
+                ),
+                "index_memory_bytes": rss_after - rss_before if rss_before is not None else None,
+            },
+            "queries": per_query,
+        }
+    finally:
+        if index is not None:
+            index.close()
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def compare_results(old: dict, new: dict) -> list[str]:
+    """Human-readable deltas of the headline numbers between two result files."""
+    lines = []
+    if old.get("golden_set_version") != new.get("golden_set_version"):
+        lines.append("Warning: results come from different golden set versions.")
+    for section, keys in [("quality", None), ("latency_ms", ["p50", "p99"]), ("index", ["build_seconds", "disk_bytes", "index_memory_bytes"])]:
+        keys = keys or [key for key in new[section] if key != "by_domain"]
+        for key in keys:
+            before, after = old.get(section, {}).get(key), new[section].get(key)
+            if isinstance(before, (int, float)) and isinstance(after, (int, float)):
+                lines.append(f"{section}.{key}: {before} -> {after} ({after - before:+.4g})")
+    return lines
@@ -0,0 +1,140 @@
+# backend/app/rag/dedup.py
+
+import json
+import re
+import zlib
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.rag.page_store import IDENTICAL_COPIES_KEY
+
+# --- Near-Duplicate Detection (MinHash + LSH) ---
+# The consolidated codes repeat boilerplate pages, headers and whole articles across
+# versions, and the splitter overlap adds more repetition. Before embedding, pages and
+# chunks are reduced to MinHash signatures over word shingles; LSH banding finds
+# candidate pairs cheaply and the signature agreement (an estimate of the Jaccard
+# similarity) decides whether a candidate is a near-duplicate.
+#
+# The first occurrence of a text is kept. Its metadata records where all dropped copies
+# came from, so citations can still point at every source.
+NUM_PERM = 128
+LSH_BANDS = 16 # 16 bands x 8 rows: pairs above ~0.7 similarity almost always become candidates
+SHINGLE_SIZE = 5 # words per shingle
+_MERSENNE_PRIME = np.uint64((1 << 61) - 1)
+_MAX_HASH = np.uint64(0xFFFFFFFF)
+
+_rng = np.random.RandomState(1)
+# a, b < 2**32 and 32-bit shingle hashes keep a * x + b within uint64
+_PERM_A = _rng.randint(1, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+_PERM_B = _rng.randint(0, 1 << 32, size=NUM_PERM, dtype=np.uint64)
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Metadata keys added to kept documents (ChromaDB metadata must be scalar, hence the JSON string).
+# The page-level count is copied into every chunk split from a page, so chunk deduplication
+# counts the chunks it drops under a key of its own.
+DUPLICATE_SOURCES_KEY = "duplicate_sources"
+DUPLICATE_COUNT_KEY = "duplicate_count"
+CHUNK_DUPLICATE_COUNT_KEY = "chunk_duplicate_count"
+
+
+def _shingle_hashes(text: str) -> np.ndarray:
+    words = _WORD_RE.findall(text.lower())
+    if not words:
+        return np.empty(0, dtype=np.uint64)
+    if len(words) <= SHINGLE_SIZE:
+        shingles = {" ".join(words)}
+    else:
+        shingles = {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signature(text: str) -> np.ndarray | None:
+    """Returns the MinHash signature of text, or None if it has no words."""
+    hashes = _shingle_hashes(text)
+    if hashes.size == 0:
+        return None
+    permuted = np.bitwise_and((np.outer(hashes, _PERM_A) + _PERM_B) % _MERSENNE_PRIME, _MAX_HASH)
+    return permuted.min(axis=0)
+
+
+def _source_label(metadata: dict) -> str:
+    return f"{metadata.get('source', '?')}#page={metadata.get('page', '?')}"
+
+
+def _provenance(metadata: dict) -> list[str]:
+    """All sources a document stands for: itself, identical copies of its PDF and anything it already absorbed."""
+    sources = [_source_label(metadata)]
+    for path in json.loads(metadata.get(IDENTICAL_COPIES_KEY, "[]")):
+        sources.append(_source_label({**metadata, "source": path}))
+    if DUPLICATE_SOURCES_KEY in metadata:
+        sources.extend(json.loads(metadata[DUPLICATE_SOURCES_KEY]))
+    return sources
+
+
+def deduplicate_documents(documents: list, threshold: float = None, count_key: str = DUPLICATE_COUNT_KEY) -> tuple[list, dict]:
+    """
+    Drops near-duplicate LangChain Documents, keeping the first occurrence of each.
+
+    Kept documents that absorbed duplicates get 'duplicate_sources' (JSON list of
+    "source#page=N" labels of the dropped copies) and the number of dropped documents under
+    count_key in their metadata (CHUNK_DUPLICATE_COUNT_KEY when deduplicating chunks).
+    Documents without any words are passed through untouched.
+
+    Returns:
+        (kept_documents, stats) where stats has 'input', 'kept', 'removed' and 'removed_chars'.
+    """
+    threshold = settings.DEDUP_THRESHOLD if threshold is None else threshold
+    rows = NUM_PERM // LSH_BANDS
+    buckets = {} # (band, band signature bytes) -> indexes into `kept`
+    kept, kept_signatures, absorbed, absorbed_counts = [], [], [], []
+    removed_chars = 0
+
+    for doc in documents:
+        signature = minhash_signature(doc.page_content)
+        if signature is None:
+            kept.append(doc)
+            kept_signatures.append(None)
+            absorbed.append([])
+            absorbed_counts.append(0)
+            continue
+
+        band_keys = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(LSH_BANDS)]
+        candidates = sorted({i for key in band_keys for i in buckets.get(key, ())})
+        match = next(
+            (i for i in candidates if np.mean(kept_signatures[i] == signature) >= threshold),
+            None,
+        )
+        if match is not None:
+            absorbed[match].extend(_provenance(doc.metadata))
+            absorbed_counts[match] += 1
+            removed_chars += len(doc.page_content)
+            continue
+
+        for key in band_keys:
+            buckets.setdefault(key, []).append(len(kept))
+        kept.append(doc)
+        kept_signatures.append(signature)
+        absorbed.append([])
+        absorbed_counts.append(0)
+
+    for doc, sources, count in zip(kept, absorbed, absorbed_counts):
+        if not sources:
+            continue
+        # Copy the metadata: the same dict may be shared with documents split from the same page
+        metadata = dict(doc.metadata)
+        previous = json.loads(metadata.get(DUPLICATE_SOURCES_KEY, "[]"))
+        # Chunks of the same page share labels; list every other location once
+        merged = [label for label in dict.fromkeys(previous + sources) if label != _source_label(metadata)]
+        metadata[DUPLICATE_SOURCES_KEY] = json.dumps(merged, ensure_ascii=False)
+        metadata[count_key] = metadata.get(count_key, 0) + count
+        doc.metadata = metadata
+
+    stats = {
+        "input": len(documents),
+        "kept": len(kept),
+        "removed": len(documents) - len(kept),
+        "removed_chars": removed_chars,
+    }
+    return kept, stats
@@ -0,0 +1,121 @@
+# backend/app/rag/generations.py
+
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+from backend.app.core.config import settings
+
+# --- Index Generations ---
+# Each full (re)build of the vector index goes into its own directory (a "generation")
+# under INDEX_GENERATIONS_PATH. A small CURRENT file names the generation the API
+# should serve. Builds never touch the generation being served, so switching is just
+# rewriting CURRENT and swapping the in-memory handle in retriever.py.
+#
+#   <INDEX_GENERATIONS_PATH>/CURRENT                      name of the active generation
+#   <INDEX_GENERATIONS_PATH>/<name>/generation.json       embedding model, build stats
+#   <INDEX_GENERATIONS_PATH>/<name>/...                   ChromaDB files
+CURRENT_POINTER_FILE = "CURRENT"
+GENERATION_META_FILE = "generation.json"
+
+
+def generation_path(name: str) -> str:
+    """Returns the directory of the named generation."""
+    return os.path.join(settings.INDEX_GENERATIONS_PATH, name)
+
+
+def new_generation_name() -> str:
+    """Returns a fresh, sortable generation name based on the current UTC time."""
+    return "gen-" + datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+
+
+def create_generation_dir() -> tuple[str, str]:
+    """Creates an empty directory for a new generation and returns (name, path)."""
+    name = new_generation_name()
+    path = generation_path(name)
+    os.makedirs(path, exist_ok=False)
+    return name, path
+
+
+def make_generation_meta(embedding_model_type: str, embedding_model_name: str, stats: dict) -> dict:
+    """Builds the generation.json content for a generation built with the current chunking settings."""
+    return {
+        "embedding_model_type": embedding_model_type,
+        "embedding_model_name": embedding_model_name,
+        "chunk_size": settings.CHUNK_SIZE,
+        "chunk_overlap": settings.CHUNK_OVERLAP,
+        "hierarchical": bool(stats.get("summaries")),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "stats": stats,
+    }
+
+
+def write_generation_meta(name: str, meta: dict):
+    path = os.path.join(generation_path(name), GENERATION_META_FILE)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+
+def read_generation_meta(name: str) -> dict:
+    """Returns the metadata of a generation, or an empty dict if it has none."""
+    path = os.path.join(generation_path(name), GENERATION_META_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def list_generations() -> list[str]:
+    """Lists complete generations (those with metadata), oldest first."""
+    if not os.path.isdir(settings.INDEX_GENERATIONS_PATH):
+        return []
+    return sorted(
+        name for name in os.listdir(settings.INDEX_GENERATIONS_PATH)
+        if os.path.exists(os.path.join(generation_path(name), GENERATION_META_FILE))
+    )
+
+
+def get_current_generation() -> str | None:
+    """Returns the name of the active generation, or None if no generation was ever activated."""
+    pointer = os.path.join(settings.INDEX_GENERATIONS_PATH, CURRENT_POINTER_FILE)
+    if not os.path.exists(pointer):
+        return None
+    with open(pointer, "r", encoding="utf-8") as f:
+        name = f.read().strip()
+    if not name or not os.path.isdir(generation_path(name)):
+        print(f"Warning: CURRENT points to missing index generation '{name}'. Ignoring it.")
+        return None
+    return name
+
+
+def set_current_generation(name: str):
+    """Atomically points CURRENT at the named generation."""
+    os.makedirs(settings.INDEX_GENERATIONS_PATH, exist_ok=True)
+    pointer = os.path.join(settings.INDEX_GENERATIONS_PATH, CURRENT_POINTER_FILE)
+    tmp_pointer = pointer + ".tmp"
+    with open(tmp_pointer, "w", encoding="utf-8") as f:
+        f.write(name)
+    os.replace(tmp_pointer, pointer)
+
+
+def remove_generation(name: str):
+    shutil.rmtree(generation_path(name), ignore_errors=True)
+
+
+def prune_generations(keep: int = None, in_use: set = frozenset()):
+    """
+    Deletes the oldest generations, keeping the active one plus the `keep` most recent others.
+    At least one other is always kept: the previously active generation, for rolling back.
+    Generations in `in_use` (still open in this process, see retriever.open_generations) are
+    never deleted; they are pruned on a later call once closed.
+    """
+    keep = max(settings.INDEX_GENERATIONS_KEEP if keep is None else keep, 1)
+    current = get_current_generation()
+    others = [name for name in list_generations() if name != current]
+    for name in others[:max(len(others) - keep, 0)]:
+        if name in in_use:
+            print(f"Keeping old index generation {name} for now: still in use.")
+            continue
+        print(f"Removing old index generation: {name}")
+        remove_generation(name)
@@ -0,0 +1,345 @@
+# backend/app/rag/hierarchy.py
+
+import hashlib
+import json
+import os
+import re
+import threading
+
+import numpy as np
+from langchain_core.documents import Document
+
+from backend.app.core.config import settings
+
+# --- Three-Level Summary Index ---
+# Above the chunk vectors, optional collections hold one summary per document and one per
+# article ("Artigo 128.º ...") longer than a chunk; a shorter article is its own summary.
+# A query first searches the small document collection, then ranks the articles of the chosen
+# documents, and finally only the chunks of the chosen articles and the chosen documents' chunks
+# that no article summary covers (judgements, preambles, short articles). Chunks carry
+# 'file_hash' and 'article_id' metadata to group them.
+DOCUMENT_SUMMARY_COLLECTION_NAME = "legal_document_summaries"
+ARTICLE_SUMMARY_COLLECTION_NAME = "legal_article_summaries"
+# Collections a rebuild replaces; "legal_summaries" held both levels in earlier builds
+SUMMARY_COLLECTION_NAMES = (DOCUMENT_SUMMARY_COLLECTION_NAME, ARTICLE_SUMMARY_COLLECTION_NAME, "legal_summaries")
+LEVEL_DOCUMENT = "document"
+LEVEL_ARTICLE = "article"
+
+# Article headings, e.g. "Artigo 1.º", "ARTIGO 128º (Dever de obediência)", "«Artigo 14.º", "Article 13".
+# They start a line (possibly after a "- 57 -" page number). "Artigo"/"ARTIGO" after two or more
+# spaces mid-line also counts, in every document: some extractions (the Código Civil) flatten
+# headings into the running text that way. Other mid-line mentions ("... relies on Article 13 of
+# the Staff Regulations", "Alterado pelo/a Artigo 3.º do/a ...", "COM O ARTIGO 47.º") are cross-references.
+ARTICLE_HEADING_RE = re.compile(
+    r"(?:^[^\S\n]*(?:-\s?\d+\s?-\s*)?[«\"]?(?:Artigo|ARTIGO|Article)|(?<=\s\s)(?:Artigo|ARTIGO))"
+    r"\s+(\d+(?:\s?\.?\s?º)?(?:-[A-Z]{1,2})?)(?:\s*\(([^)\n]{1,150})\))?",
+    re.MULTILINE,
+)
+# Judgements are not divided into articles; the articles they cite belong to other documents
+JUDGEMENT_SOURCE_RE = re.compile(r"judge?ment|ac[oó]rd[aã]o", re.IGNORECASE)
+
+MAX_SUMMARY_INPUT_CHARS = 4000 # Text sent to the summarizer per article/document
+EXTRACTIVE_SUMMARY_CHARS = 500
+
+
+# --- Article Detection ---
+def _page_key(metadata: dict) -> tuple:
+    return metadata.get("file_hash") or metadata.get("source"), metadata.get("page")
+
+
+def is_judgement(source: str) -> bool:
+    return bool(JUDGEMENT_SOURCE_RE.search(os.path.basename(source)))
+
+
+def detect_articles(pages: list) -> tuple[dict, list]:
+    """
+    Finds article headings in the pages (in page-store order) and returns
+      - page_spans: (file, page) -> (article at page start, [(offset, article), ...] for headings on the page)
+      - articles: one dict per article with 'article_id', 'label', 'file_hash', 'source' and 'text'
+    Judgements get no articles, so all of their chunks stay in scope of the coarse-to-fine search.
+    """
+    page_spans, articles = {}, []
+    current_file, current, ordinal = None, None, 0
+
+    for page in pages:
+        file_key, _ = _page_key(page.metadata)
+        if file_key != current_file:
+            current_file, current, ordinal = file_key, None, 0
+        if is_judgement(page.metadata.get("source", "")):
+            page_spans[_page_key(page.metadata)] = (None, [])
+            continue
+        text = page.page_content
+        at_start, headings = current, []
+        last_offset = 0
+        for match in ARTICLE_HEADING_RE.finditer(text):
+            if current is not None:
+                current["text"] += text[last_offset:match.start()]
+                current["length"] += match.start() - last_offset
+            label = "Artigo " + re.sub(r"\s+", "", match.group(1))
+            if match.group(2):
+                label += f" ({match.group(2).strip()})"
+            ordinal += 1
+            current = {
+                "article_id": f"{file_key}:{ordinal}",
+                "label": label,
+                "file_hash": file_key,
+                "source": page.metadata.get("source", ""),
+                "text": "",
+                "length": 0, # Of the full text; 'text' stops at MAX_SUMMARY_INPUT_CHARS
+            }
+            articles.append(current)
+            headings.append((match.start(), current))
+            last_offset = match.start()
+        if current is not None:
+            current["length"] += len(text) - last_offset
+            if len(current["text"]) < MAX_SUMMARY_INPUT_CHARS:
+                current["text"] += text[last_offset:]
+        page_spans[_page_key(page.metadata)] = (at_start, headings)
+
+    for article in articles:
+        article["text"] = article["text"][:MAX_SUMMARY_INPUT_CHARS]
+    return page_spans, articles
+
+
+def assign_articles(chunks: list, page_spans: dict):
+    """Sets 'article_id'/'article' metadata on chunks split with add_start_index=True ('' outside articles)."""
+    for chunk in chunks:
+        article = None
+        spans = page_spans.get(_page_key(chunk.metadata))
+        if spans:
+            article, headings = spans
+            start = chunk.metadata.get("start_index", 0)
+            for offset, heading_article in headings:
+                if offset > start:
+                    break
+                article = heading_article
+        chunk.metadata = dict(chunk.metadata)
+        chunk.metadata["article_id"] = article["article_id"] if article else ""
+        chunk.metadata["article"] = article["label"] if article else ""
+
+
+# --- Summarizers ---
+# A summarizer is any callable (text, kind) -> str, where kind is LEVEL_DOCUMENT or LEVEL_ARTICLE.
+def extractive_summarizer(text: str, kind: str) -> str:
+    """Local stand-in for an LLM: the leading sentences of the text, whitespace-normalized."""
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) <= EXTRACTIVE_SUMMARY_CHARS:
+        return text
+    cut = text.rfind(". ", 0, EXTRACTIVE_SUMMARY_CHARS)
+    return text[:cut + 1] if cut > EXTRACTIVE_SUMMARY_CHARS // 2 else text[:EXTRACTIVE_SUMMARY_CHARS]
+
+
+def make_gemini_summarizer():
+    """Summarizer backed by the configured Gemini model (one LLM call per document/article)."""
+    from langchain_google_genai import ChatGoogleGenerativeAI # Only needed for this backend
+
+    llm = ChatGoogleGenerativeAI(
+        model=settings.GEMINI_MODEL_NAME,
+        google_api_key=settings.GOOGLE_API_KEY,
+        convert_system_message_to_human=True
+    )
+    prompts = {
+        LEVEL_DOCUMENT: "Summarize in at most 5 sentences what this legal document covers, "
+                        "naming its main subjects so it can be found by search:\n\n{text}",
+        LEVEL_ARTICLE: "Summarize in at most 2 sentences what this legal article regulates:\n\n{text}",
+    }
+
+    def summarize(text: str, kind: str) -> str:
+        return llm.invoke(prompts[kind].format(text=text)).content.strip()
+    return summarize
+
+
+SUMMARIZER_BACKENDS = {
+    "extractive": lambda: extractive_summarizer,
+    "gemini": make_gemini_summarizer,
+}
+
+
+class CachedSummarizer:
+    """
+    Wraps a summarizer with a JSON cache in the page store, keyed by backend and input text,
+    so rebuilding the index does not summarize unchanged articles again.
+    """
+
+    def __init__(self, summarize, backend: str, store_path: str = None):
+        self._summarize = summarize
+        self._backend = backend
+        self._path = os.path.join(store_path or settings.PAGE_STORE_PATH, f"summaries_{backend}.json")
+        self._lock = threading.Lock()
+        self._cache = {}
+        if os.path.exists(self._path):
+            with open(self._path, "r", encoding="utf-8") as f:
+                self._cache = json.load(f)
+        self.hits = self.misses = 0
+
+    def __call__(self, text: str, kind: str) -> str:
+        key = hashlib.sha1(f"{kind}\0{text}".encode("utf-8")).hexdigest()
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                return self._cache[key]
+        summary = self._summarize(text, kind)
+        with self._lock:
+            self._cache[key] = summary
+            self.misses += 1
+        return summary
+
+    def save(self):
+        os.makedirs(os.path.dirname(self._path), exist_ok=True)
+        tmp_path = self._path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._cache, f, ensure_ascii=False)
+        os.replace(tmp_path, self._path)
+
+
+def get_summarizer(backend: str = None):
+    """Returns the summarizer for the given (or configured) backend; LLM backends are cached on disk."""
+    backend = backend or settings.SUMMARY_BACKEND
+    if backend not in SUMMARIZER_BACKENDS:
+        raise ValueError(f"Unsupported SUMMARY_BACKEND: {backend} (expected one of {list(SUMMARIZER_BACKENDS)})")
+    if backend == "extractive":
+        return extractive_summarizer # Cheaper to recompute than to cache
+    return CachedSummarizer(SUMMARIZER_BACKENDS[backend](), backend)
+
+
+# --- Summary Documents ---
+def build_summary_documents(pages: list, articles: list, summarizer=None) -> list:
+    """
+    Builds one summary Document per source document and per article of at least CHUNK_SIZE
+    characters, ready for embedding. Shorter articles fit in about one chunk, which the search
+    ranks directly.
+    """
+    summarizer = summarizer or get_summarizer()
+    summaries = []
+
+    articles_by_file = {}
+    for article in articles:
+        articles_by_file.setdefault(article["file_hash"], []).append(article)
+
+    first_pages = {}
+    for page in pages:
+        file_key, _ = _page_key(page.metadata)
+        if file_key not in first_pages:
+            first_pages[file_key] = page
+        elif len(first_pages[file_key].page_content.strip()) < 200:
+            # Skip (nearly) empty cover pages
+            first_pages[file_key] = page
+
+    try:
+        for file_key, page in first_pages.items():
+            source = page.metadata.get("source", "")
+            title = os.path.splitext(os.path.basename(source))[0]
+            headings = "; ".join(a["label"] for a in articles_by_file.get(file_key, [])[:40])
+            text = f"{title}\n{page.page_content}\n{headings}"[:MAX_SUMMARY_INPUT_CHARS]
+            summaries.append(Document(
+                page_content=f"{title}: {summarizer(text, LEVEL_DOCUMENT)}",
+                metadata={"level": LEVEL_DOCUMENT, "file_hash": file_key, "source": source,
+                          "article_id": "", "article": ""},
+            ))
+
+        for article in articles:
+            if article["length"] < settings.CHUNK_SIZE:
+                continue
+            summary = summarizer(article["text"], LEVEL_ARTICLE)
+            summaries.append(Document(
+                page_content=f"{article['label']}: {summary}",
+                metadata={"level": LEVEL_ARTICLE, "file_hash": article["file_hash"], "source": article["source"],
+                          "article_id": article["article_id"], "article": article["label"]},
+            ))
+    finally:
+        if isinstance(summarizer, CachedSummarizer):
+            summarizer.save()
+            print(f"Summaries: {summarizer.hits} reused from cache, {summarizer.misses} generated.")
+    return summaries
+
+
+# --- Coarse-to-Fine Search ---
+# ChromaDB 0.4 evaluates 'where' filters in SQLite, which costs more than a flat HNSW search of
+# the whole chunk collection, and every query or get() costs about a millisecond on its own. So
+# the vectors of all three levels and the chunk texts are loaded once when the index is opened,
+# and a search is ranked entirely in memory.
+def _group_rows(keys) -> dict:
+    groups = {}
+    for row, key in enumerate(keys):
+        if key:
+            groups.setdefault(key, []).append(row)
+    return {key: np.asarray(rows) for key, rows in groups.items()}
+
+
+def _matrix(embeddings: list) -> tuple[np.ndarray, np.ndarray]:
+    """The vectors as a matrix, with their squared norms for _nearest."""
+    vectors = np.asarray(embeddings, dtype=np.float32) if embeddings else np.empty((0, 0), dtype=np.float32)
+    return vectors, np.einsum("ij,ij->i", vectors, vectors)
+
+
+class SearchScope:
+    """Vectors of the document summaries, article summaries and chunks (with their texts), grouped by document and article."""
+
+    def __init__(self, chunk_collection, document_collection, article_collection=None):
+        found = document_collection.get(include=["embeddings", "metadatas"])
+        self.file_hashes = [metadata["file_hash"] for metadata in found["metadatas"]]
+        self.document_vectors, self.document_norms = _matrix(found["embeddings"])
+
+        found = article_collection.get(include=["embeddings", "metadatas"]) if article_collection else {
+            "embeddings": [], "metadatas": []
+        }
+        self.article_ids = [metadata["article_id"] for metadata in found["metadatas"]]
+        self.article_vectors, self.article_norms = _matrix(found["embeddings"])
+        self.articles_by_file = _group_rows(metadata["file_hash"] for metadata in found["metadatas"])
+        summarized = set(self.article_ids)
+
+        found = chunk_collection.get(include=["embeddings", "documents", "metadatas"])
+        self.chunk_texts = found["documents"]
+        self.chunk_metadatas = found["metadatas"]
+        self.chunk_vectors, self.chunk_norms = _matrix(found["embeddings"])
+        self.chunks_by_article = _group_rows(
+            metadata.get("article_id") if metadata.get("article_id") in summarized else None
+            for metadata in found["metadatas"]
+        )
+        # Chunks outside any summarized article are ranked directly when their document is chosen
+        self.loose_chunks_by_file = _group_rows(
+            None if metadata.get("article_id") in summarized else metadata.get("file_hash")
+            for metadata in found["metadatas"]
+        )
+
+
+def _rows(groups: dict, keys: list) -> np.ndarray:
+    selected = [groups[key] for key in keys if key in groups]
+    return np.concatenate(selected) if selected else np.empty(0, dtype=int)
+
+
+def _nearest(vectors: np.ndarray, norms: np.ndarray, rows: np.ndarray, query: np.ndarray, n: int) -> np.ndarray:
+    """
+    The n of `rows` whose vectors are closest to query by squared L2 distance, the metric of the
+    collections: |v|^2 - 2 v.q, leaving out the |q|^2 all rows share.
+    """
+    if not rows.size:
+        return rows
+    distances = norms[rows] - 2 * (vectors[rows] @ query)
+    return rows[np.argsort(distances, kind="stable")[:n]]
+
+
+def search_in_scope(scope: SearchScope, query_embedding: list, k: int) -> list | None:
+    """
+    Returns the k chunks closest to the query among the chunks of the HIERARCHY_TOP_DOCUMENTS
+    closest documents: those of their HIERARCHY_TOP_ARTICLES closest articles, and those no
+    article summary covers.
+    Returns None (search everything) if the index has no document summaries.
+    """
+    if not scope.file_hashes:
+        return None
+    query = np.asarray(query_embedding, dtype=np.float32)
+    document_rows = _nearest(scope.document_vectors, scope.document_norms, np.arange(len(scope.file_hashes)), query,
+                             settings.HIERARCHY_TOP_DOCUMENTS)
+    file_hashes = [scope.file_hashes[row] for row in document_rows]
+    article_rows = _nearest(scope.article_vectors, scope.article_norms, _rows(scope.articles_by_file, file_hashes),
+                            query, settings.HIERARCHY_TOP_ARTICLES)
+    article_ids = [scope.article_ids[row] for row in article_rows]
+    chunk_rows = np.concatenate([_rows(scope.chunks_by_article, article_ids), _rows(scope.loose_chunks_by_file, file_hashes)])
+    print(f"Summary index selected {len(file_hashes)} document(s) and {len(article_ids)} article(s): "
+          f"{len(chunk_rows)} chunks to rank.")
+
+    return [
+        Document(page_content=scope.chunk_texts[row], metadata=dict(scope.chunk_metadatas[row]))
+        for row in _nearest(scope.chunk_vectors, scope.chunk_norms, chunk_rows, query, k)
+    ]
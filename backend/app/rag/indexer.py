@@ -1,64 +1,211 @@
 import os
+import time
 import chromadb
-from langchain.vectorstores import Chroma
+from langchain_community.vectorstores import Chroma
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFDirectoryLoader # Use community loader
 from backend.app.core.config import settings
 from backend.app.rag.retriever import get_embedding_function # Reuse the embedding function
+from backend.app.rag.page_store import build_page_store, load_page_documents
+from backend.app.rag.dedup import CHUNK_DUPLICATE_COUNT_KEY, deduplicate_documents
+from backend.app.rag.hierarchy import (
+    ARTICLE_SUMMARY_COLLECTION_NAME,
+    DOCUMENT_SUMMARY_COLLECTION_NAME,
+    LEVEL_DOCUMENT,
+    SUMMARY_COLLECTION_NAMES,
+    assign_articles,
+    build_summary_documents,
+    detect_articles,
+)
+from backend.app.rag.templates import build_template_index, is_template_document, write_template_index
 
-def index_documents():
-    """Loads PDFs, splits them, creates embeddings, and stores them in ChromaDB."""
-    print(f"Starting document indexing process...")
-    print(f"Loading documents from: {settings.LEGAL_DOCS_PATH}")
+def load_and_split_documents(skip_extraction: bool = False, stats: dict = None, summarizer=None) -> tuple[list, list, list]:
+    """
+    Loads the pages from the page store (extracting new/changed PDFs first, unless skip_extraction),
+    drops near-duplicate pages, splits them into chunks and drops near-duplicate chunks.
+    Chunks are tagged with the article they belong to. Pages of the document templates
+    (legal_docs/doc_examples) are set aside instead of being chunked.
+    Raises on failure; returns empty lists if there is nothing to index.
 
-    if not os.path.exists(settings.LEGAL_DOCS_PATH) or not os.listdir(settings.LEGAL_DOCS_PATH):
-        print(f"Warning: Document directory '{settings.LEGAL_DOCS_PATH}' is empty or does not exist.")
-        print("No documents to index.")
-        # Create the DB directory anyway if it doesn't exist
-        if not os.path.exists(settings.VECTOR_DB_PATH):
-            os.makedirs(settings.VECTOR_DB_PATH)
-            print(f"Created empty vector database directory: {settings.VECTOR_DB_PATH}")
-        return False # Indicate nothing was indexed
+    If a stats dict is given, page/chunk counts and deduplication results are recorded in it.
+    summarizer overrides the SUMMARY_BACKEND summarizer (see rag/hierarchy.py).
 
-    # 1. Load Documents
-    loader = PyPDFDirectoryLoader(settings.LEGAL_DOCS_PATH)
-    try:
-        documents = loader.load()
-        if not documents:
-             print("No documents were loaded successfully from the directory.")
-             return False
-        print(f"Loaded {len(documents)} document pages/sections.")
-    except Exception as e:
-        print(f"Error loading documents: {e}")
-        return False
+    Returns:
+        (chunks, summaries, template_pages) where summaries are the document/article summary
+        Documents, or an empty list unless HIERARCHICAL_INDEX_ENABLED.
+    """
+    stats = {} if stats is None else stats
+
+    # 1. Load Documents (PDFs are only parsed if they are not in the page store yet)
+    if not skip_extraction:
+        build_page_store(settings.LEGAL_DOCS_PATH, settings.PAGE_STORE_PATH)
+    documents = load_page_documents(settings.PAGE_STORE_PATH)
+    if not documents:
+        print("No documents were loaded from the page store.")
+        return [], [], []
+    print(f"Loaded {len(documents)} document pages/sections.")
+
+    # Templates are looked up by document type (see rag/templates.py), not searched
+    template_pages = [doc for doc in documents if is_template_document(doc.metadata)]
+    if template_pages:
+        documents = [doc for doc in documents if not is_template_document(doc.metadata)]
+        print(f"Set aside {len(template_pages)} document template pages; {len(documents)} pages left to index.")
+    stats["pages"] = len(documents)
+
+    # Articles are detected on the full page sequence, before deduplication leaves gaps in it
+    page_spans, articles = detect_articles(documents)
+    summaries = []
+    if settings.HIERARCHICAL_INDEX_ENABLED:
+        backend = getattr(summarizer, "__name__", "custom") if summarizer else settings.SUMMARY_BACKEND
+        print(f"Summarizing {len(articles)} articles with the '{backend}' backend...")
+        summaries = build_summary_documents(documents, articles, summarizer)
+        stats["summaries"] = len(summaries)
 
+    if settings.DEDUP_ENABLED:
+        documents, stats["page_dedup"] = deduplicate_documents(documents)
+        print(f"Page deduplication removed {stats['page_dedup']['removed']} near-duplicate pages.")
 
     # 2. Split Documents
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Adjust size as needed
-        chunk_overlap=200   # Adjust overlap as needed
+        chunk_size=settings.CHUNK_SIZE,
+        chunk_overlap=settings.CHUNK_OVERLAP,
+        add_start_index=True # Needed to tell which article a chunk starts in
     )
     texts = text_splitter.split_documents(documents)
+    assign_articles(texts, page_spans)
     print(f"Split documents into {len(texts)} text chunks.")
 
+    if settings.DEDUP_ENABLED:
+        texts, stats["chunk_dedup"] = deduplicate_documents(texts, count_key=CHUNK_DUPLICATE_COUNT_KEY)
+        print(f"Chunk deduplication removed {stats['chunk_dedup']['removed']} near-duplicate chunks; "
+              f"{len(texts)} chunks left to embed.")
+    return texts, summaries, template_pages
+
+def _directory_size(path: str) -> int:
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files
+    )
+
+def _reset_collections(persist_directory: str):
+    """Drops the chunk and summary collections of an earlier build, so a rebuild replaces them instead of adding to them."""
+    client = chromadb.PersistentClient(path=persist_directory)
+    for collection in client.list_collections():
+        if collection.name in (Chroma._LANGCHAIN_DEFAULT_COLLECTION_NAME, *SUMMARY_COLLECTION_NAMES):
+            print(f"Dropping collection '{collection.name}' of the previous build.")
+            client.delete_collection(collection.name)
+
+def build_vector_index(persist_directory: str, embedding_function=None, skip_extraction: bool = False,
+                       summarizer=None) -> dict:
+    """
+    Builds a complete vector index in persist_directory.
+
+    Args:
+        persist_directory: Where ChromaDB should store the index. Collections of an earlier
+            build in the same directory are replaced.
+        embedding_function: Embedding model to use; defaults to the configured one.
+        skip_extraction: Read the page store as-is instead of checking the PDFs for changes first.
+        summarizer: Summarizer for the hierarchical index; defaults to the SUMMARY_BACKEND one.
+
+    Returns:
+        A dict of build statistics ('chunks', 'build_seconds', ...). 'chunks' is 0 if there was nothing to index.
+    """
+    started = time.perf_counter()
+    stats = {}
+    texts, summaries, template_pages = load_and_split_documents(skip_extraction, stats, summarizer)
     if not texts:
-        print("No text chunks generated after splitting.")
-        return False
+        stats.update({"chunks": 0, "build_seconds": round(time.perf_counter() - started, 3)})
+        return stats
 
     # 3. Get Embedding Function
-    embedding_function = get_embedding_function()
+    embedding_function = embedding_function or get_embedding_function()
 
     # 4. Create and Persist Vector Store
-    print(f"Creating/updating vector store at: {settings.VECTOR_DB_PATH}")
+    print(f"Creating/updating vector store at: {persist_directory}")
     # This will create the directory if it doesn't exist
+    os.makedirs(persist_directory, exist_ok=True)
+    _reset_collections(persist_directory)
+    embedding_started = time.perf_counter()
     vector_store = Chroma.from_documents(
         documents=texts,
         embedding=embedding_function,
-        persist_directory=settings.VECTOR_DB_PATH
+        persist_directory=persist_directory
         # collection_name="legal_documents" # Optional: specify collection name
     )
 
     # Explicitly persist (good practice, though often done automatically on creation/add)
     vector_store.persist()
-    print(f"Successfully indexed {len(texts)} chunks to {settings.VECTOR_DB_PATH}")
-    return True
\ No newline at end of file
+    finished = time.perf_counter()
+
+    # 5. Summary Collections (coarse levels of the hierarchical index)
+    if summaries:
+        print(f"Embedding {len(summaries)} document/article summaries...")
+        document_summaries = [doc for doc in summaries if doc.metadata["level"] == LEVEL_DOCUMENT]
+        article_summaries = [doc for doc in summaries if doc.metadata["level"] != LEVEL_DOCUMENT]
+        for collection_name, level_summaries in [(DOCUMENT_SUMMARY_COLLECTION_NAME, document_summaries),
+                                                 (ARTICLE_SUMMARY_COLLECTION_NAME, article_summaries)]:
+            if level_summaries:
+                summary_store = Chroma.from_documents(
+                    documents=level_summaries,
+                    embedding=embedding_function,
+                    collection_name=collection_name,
+                    persist_directory=persist_directory
+                )
+                summary_store.persist()
+        stats["summary_seconds"] = round(time.perf_counter() - finished, 3)
+
+    # 6. Template Index (document type -> template structure, next to the vectors)
+    template_index = build_template_index(template_pages)
+    write_template_index(persist_directory, template_index)
+    stats["templates"] = len(template_index["templates"])
+    print(f"Successfully indexed {len(texts)} chunks to {persist_directory}")
+    stats.update({
+        "chunks": len(texts),
+        "embedding_seconds": round(finished - embedding_started, 3),
+        "build_seconds": round(time.perf_counter() - started, 3),
+        "index_bytes": _directory_size(persist_directory),
+    })
+    if "chunk_dedup" in stats:
+        _report_dedup_savings(stats)
+    return stats
+
+def _report_dedup_savings(stats: dict):
+    """
+    Estimates what deduplication saved, assuming embedding time and index size scale with the
+    number of chunks, and records it under stats['dedup_savings'].
+    """
+    # Chunks that were never produced because their whole page was a duplicate count as well
+    pages_removed = stats.get("page_dedup", {}).get("removed", 0)
+    chunks_per_page = stats["chunk_dedup"]["input"] / max(stats["pages"] - pages_removed, 1)
+    chunks_removed = stats["chunk_dedup"]["removed"] + round(pages_removed * chunks_per_page)
+    per_chunk_seconds = stats["embedding_seconds"] / stats["chunks"]
+    per_chunk_bytes = stats["index_bytes"] / stats["chunks"]
+    savings = {
+        "chunks_removed": chunks_removed,
+        "chunks_removed_pct": round(100 * chunks_removed / (stats["chunks"] + chunks_removed), 2),
+        "embedding_seconds_saved": round(chunks_removed * per_chunk_seconds, 3),
+        "index_bytes_saved": round(chunks_removed * per_chunk_bytes),
+    }
+    stats["dedup_savings"] = savings
+    print(f"Deduplication skipped ~{savings['chunks_removed']} chunks ({savings['chunks_removed_pct']}%): "
+          f"~{savings['embedding_seconds_saved']}s of embedding and ~{savings['index_bytes_saved']} bytes of index.")
+
+def index_documents():
+    """Extracts PDF pages into the page store, splits them, creates embeddings, and stores them in ChromaDB."""
+    print(f"Starting document indexing process...")
+    print(f"Loading documents from: {settings.LEGAL_DOCS_PATH}")
+
+    if not os.path.exists(settings.LEGAL_DOCS_PATH) or not os.listdir(settings.LEGAL_DOCS_PATH):
+        print(f"Warning: Document directory '{settings.LEGAL_DOCS_PATH}' is empty or does not exist.")
+        print("No documents to index.")
+        # Create the DB directory anyway if it doesn't exist
+        if not os.path.exists(settings.VECTOR_DB_PATH):
+            os.makedirs(settings.VECTOR_DB_PATH)
+            print(f"Created empty vector database directory: {settings.VECTOR_DB_PATH}")
+        return False # Indicate nothing was indexed
+
+    try:
+        stats = build_vector_index(settings.VECTOR_DB_PATH)
+    except Exception as e:
+        print(f"Error indexing documents: {e}")
+        return False
+    return stats["chunks"] > 0
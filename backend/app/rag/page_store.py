@@ -0,0 +1,212 @@
+# backend/app/rag/page_store.py
+
+import hashlib
+import json
+import mmap
+import os
+import traceback
+import zlib
+
+from pypdf import PdfReader
+from langchain_core.documents import Document
+
+from backend.app.core.config import settings
+
+# --- Page Store Layout ---
+# The page store is the first stage of the indexing pipeline. Every PDF is parsed
+# once and its page text is kept in a compact, compressed local store so that later
+# stages (chunking, embedding) never have to touch the PDFs again.
+#
+#   <PAGE_STORE_PATH>/pages.bin          zlib-compressed page texts, appended back to back
+#   <PAGE_STORE_PATH>/pages_index.json   (file hash, page) -> (offset, length) into pages.bin
+#
+# Files are keyed by the SHA-256 of their content, so renaming or moving a PDF does
+# not trigger a re-parse, and an edited PDF gets a new entry. Identical copies of a PDF
+# at several paths are stored once; the entry lists all of their paths.
+PAGES_DATA_FILE = "pages.bin"
+PAGES_INDEX_FILE = "pages_index.json"
+STORE_FORMAT_VERSION = 1
+# Page metadata key listing the other paths of an identical PDF (JSON, as ChromaDB metadata must be scalar)
+IDENTICAL_COPIES_KEY = "identical_copies"
+
+
+def _data_path(store_path: str) -> str:
+    return os.path.join(store_path, PAGES_DATA_FILE)
+
+
+def _index_path(store_path: str) -> str:
+    return os.path.join(store_path, PAGES_INDEX_FILE)
+
+
+def file_sha256(path: str) -> str:
+    """Returns the hex SHA-256 digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def list_pdf_files(docs_path: str) -> list[str]:
+    """Lists every non-hidden PDF below docs_path, in a stable order."""
+    pdf_files = []
+    for root, dirs, files in os.walk(docs_path):
+        dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+        for name in sorted(files):
+            if name.startswith(".") or not name.lower().endswith(".pdf"):
+                continue
+            pdf_files.append(os.path.join(root, name))
+    return pdf_files
+
+
+def load_store_index(store_path: str = None) -> dict:
+    """Loads the page store index, or returns an empty one if the store does not exist yet."""
+    store_path = store_path or settings.PAGE_STORE_PATH
+    index_file = _index_path(store_path)
+    if not os.path.exists(index_file):
+        return {"version": STORE_FORMAT_VERSION, "files": {}}
+    with open(index_file, "r", encoding="utf-8") as f:
+        index = json.load(f)
+    if index.get("version") != STORE_FORMAT_VERSION:
+        print(f"Warning: Page store at '{store_path}' has an unknown format version; it will be rebuilt.")
+        return {"version": STORE_FORMAT_VERSION, "files": {}}
+    return index
+
+
+def _write_store_index(store_path: str, index: dict):
+    # Write to a temporary file first so a crash never leaves a truncated index behind
+    tmp_file = _index_path(store_path) + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_file, _index_path(store_path))
+
+
+def build_page_store(docs_path: str = None, store_path: str = None) -> dict:
+    """
+    Extracts the page text of every PDF under docs_path into the page store.
+
+    Only PDFs whose content hash is not yet in the store are parsed; everything else is
+    reused as-is. Files that disappeared from docs_path are dropped from the index.
+    Identical PDFs are parsed and stored once; the first path walked is their 'source'.
+
+    Returns:
+        A dict with 'parsed', 'reused', 'copies' (identical to a file already seen) and 'failed'
+        file counts and the total 'pages' in the store.
+    """
+    docs_path = docs_path or settings.LEGAL_DOCS_PATH
+    store_path = store_path or settings.PAGE_STORE_PATH
+    os.makedirs(store_path, exist_ok=True)
+
+    index = load_store_index(store_path)
+    if not index["files"] and os.path.exists(_data_path(store_path)):
+        # Index missing or discarded: start the data file from scratch as well
+        os.remove(_data_path(store_path))
+
+    stats = {"parsed": 0, "reused": 0, "copies": 0, "failed": 0, "pages": 0}
+    current_files = {}
+
+    with open(_data_path(store_path), "ab") as data_file:
+        for pdf_path in list_pdf_files(docs_path):
+            rel_path = os.path.relpath(pdf_path, docs_path)
+            try:
+                file_hash = file_sha256(pdf_path)
+            except OSError as e:
+                print(f"Error reading '{rel_path}': {e}")
+                stats["failed"] += 1
+                continue
+
+            entry = current_files.get(file_hash)
+            if entry is not None:
+                entry["sources"].append(pdf_path)
+                stats["copies"] += 1
+                continue
+
+            entry = index["files"].get(file_hash)
+            if entry is not None:
+                # Keep the current location(s) of the file
+                entry["source"] = pdf_path
+                entry["sources"] = [pdf_path]
+                current_files[file_hash] = entry
+                stats["reused"] += 1
+                stats["pages"] += len(entry["pages"])
+                continue
+
+            print(f"Extracting pages from: {rel_path}")
+            try:
+                reader = PdfReader(pdf_path)
+                page_texts = [page.extract_text() or "" for page in reader.pages]
+            except Exception as e:
+                print(f"Error parsing '{rel_path}': {e}")
+                traceback.print_exc()
+                stats["failed"] += 1
+                continue
+
+            pages = []
+            for text in page_texts:
+                blob = zlib.compress(text.encode("utf-8"), 6)
+                offset = data_file.tell()
+                data_file.write(blob)
+                pages.append([offset, len(blob)])
+            current_files[file_hash] = {"source": pdf_path, "sources": [pdf_path], "pages": pages}
+            stats["parsed"] += 1
+            stats["pages"] += len(pages)
+
+    index["files"] = current_files
+    _write_store_index(store_path, index)
+    _compact_if_needed(store_path, index)
+    print(f"Page store updated at {store_path}: {stats['parsed']} file(s) parsed, "
+          f"{stats['reused']} reused, {stats['copies']} identical copies, {stats['failed']} failed, "
+          f"{stats['pages']} pages in total.")
+    return stats
+
+
+def _compact_if_needed(store_path: str, index: dict):
+    """Rewrites pages.bin without the pages of removed/changed PDFs once they take up more than half of it."""
+    data_file_path = _data_path(store_path)
+    live_bytes = sum(length for entry in index["files"].values() for _, length in entry["pages"])
+    total_bytes = os.path.getsize(data_file_path)
+    if total_bytes == 0 or live_bytes * 2 >= total_bytes:
+        return
+
+    print(f"Compacting page store ({total_bytes - live_bytes} stale bytes of {total_bytes})...")
+    tmp_data_path = data_file_path + ".tmp"
+    with open(data_file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+            open(tmp_data_path, "wb") as out:
+        for entry in index["files"].values():
+            new_pages = []
+            for offset, length in entry["pages"]:
+                new_pages.append([out.tell(), length])
+                out.write(mm[offset:offset + length])
+            entry["pages"] = new_pages
+    os.replace(tmp_data_path, data_file_path)
+    _write_store_index(store_path, index)
+
+
+def iter_page_documents(store_path: str = None):
+    """
+    Yields one LangChain Document per stored page, reading the page store through a memory map.
+
+    The metadata matches what PyPDFDirectoryLoader produces ('source', 'page'), plus the
+    'file_hash' key under which the page is stored. Pages of a PDF stored under several paths
+    are yielded once, with the other paths in 'identical_copies'.
+    """
+    store_path = store_path or settings.PAGE_STORE_PATH
+    index = load_store_index(store_path)
+    data_file_path = _data_path(store_path)
+    if not index["files"] or not os.path.exists(data_file_path) or os.path.getsize(data_file_path) == 0:
+        return
+
+    with open(data_file_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for file_hash, entry in index["files"].items():
+            copies = [path for path in entry.get("sources", []) if path != entry["source"]]
+            for page_number, (offset, length) in enumerate(entry["pages"]):
+                text = zlib.decompress(mm[offset:offset + length]).decode("utf-8")
+                metadata = {"source": entry["source"], "page": page_number, "file_hash": file_hash}
+                if copies:
+                    metadata[IDENTICAL_COPIES_KEY] = json.dumps(copies, ensure_ascii=False)
+                yield Document(page_content=text, metadata=metadata)
+
+
+def load_page_documents(store_path: str = None) -> list[Document]:
+    """Loads all pages from the page store as LangChain Documents."""
+    return list(iter_page_documents(store_path))
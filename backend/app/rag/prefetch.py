@@ -0,0 +1,195 @@
+# backend/app/rag/prefetch.py
+
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import numpy as np
+
+from backend.app.core.config import settings
+from backend.app.rag.retriever import ActiveIndex, acquire_active_index, search_documents
+
+# --- Speculative Retrieval Prefetch ---
+# The experts only search the knowledge base after the consultation task's LLM call, so the
+# index sits idle for the whole first task. At the start of a run, one search per expert
+# domain (and one for the raw query) is started in the background from the client's query.
+# The results go into a cache for that run. When an expert's tool call asks something
+# semantically close to a cached query (cosine similarity of the query embeddings), it gets
+# the cached chunks immediately. On a miss, the query vector computed for the comparison is
+# reused for the actual search, and the results are cached for the experts that follow.
+PREFETCH_DOMAIN_HINTS = {
+    "civil": "Código Civil português",
+    "fiscal": "direito fiscal português, impostos IRS IRC IVA",
+    "labour": "international civil servants labour law, ILOAT judgments",
+}
+_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="prefetch")
+
+
+def prefetch_queries(client_query: str) -> list[str]:
+    """The speculative queries for a client query: the query itself and one per expert domain."""
+    return [client_query] + [f"{client_query} ({hint})" for hint in PREFETCH_DOMAIN_HINTS.values()]
+
+
+class _CacheEntry:
+    def __init__(self, query: str, k: int, embedding: np.ndarray, results: list, search_seconds: float, prefetched: bool):
+        self.query = query
+        self.k = k
+        self.embedding = embedding # Unit length, so a dot product is the cosine similarity
+        self.results = results
+        self.search_seconds = search_seconds # Vector search time, not counting the embedding
+        self.prefetched = prefetched
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class RetrievalCache:
+    """
+    Search results of one crew run, looked up by query similarity. Pinned to the index the run
+    started with, which must have been acquired for it; close() releases it.
+    """
+
+    def __init__(self, index: ActiveIndex, threshold: float = None):
+        self.index = index
+        self.threshold = settings.PREFETCH_SIMILARITY_THRESHOLD if threshold is None else threshold
+        self._entries = []
+        self._pending = []
+        self._lock = threading.Lock()
+        self.lookups = self.hits = 0
+        self.seconds_saved = 0.0
+        self.prefetch_seconds = 0.0
+        self.prefetch_failures = 0
+
+    # --- Filling ---
+    def _fetch(self, query: str, k: int, embedding=None, prefetched: bool = False) -> _CacheEntry:
+        if embedding is None:
+            embedding = self.index.embedding_function.embed_query(query)
+        started = time.perf_counter()
+        results = search_documents(query, k, self.index, query_embedding=embedding)
+        entry = _CacheEntry(query, k, _unit(embedding), results, time.perf_counter() - started, prefetched)
+        with self._lock:
+            self._entries.append(entry)
+        return entry
+
+    def _prefetch_one(self, query: str, k: int):
+        started = time.perf_counter()
+        self._fetch(query, k, prefetched=True)
+        with self._lock:
+            self.prefetch_seconds += time.perf_counter() - started
+
+    def _prefetch_done(self, future):
+        # Exceptions would otherwise stay inside the future, and a broken prefetch would only show as misses
+        if future.cancelled() or future.exception() is None:
+            return
+        error = future.exception()
+        with self._lock:
+            self.prefetch_failures += 1
+        print(f"Error during retrieval prefetch: {error}")
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def prefetch(self, queries: list[str], k: int = 5):
+        """Starts the searches for `queries` in the background and returns immediately."""
+        self._pending = [_executor.submit(self._prefetch_one, query, k) for query in queries]
+        for future in self._pending:
+            future.add_done_callback(self._prefetch_done)
+
+    # --- Lookup ---
+    def _wait_for_prefetch(self) -> float:
+        """Lets still-running prefetches finish (bounded by PREFETCH_WAIT_SECONDS). Returns the seconds waited."""
+        pending = [future for future in self._pending if not future.done()]
+        if not pending:
+            return 0.0
+        started = time.perf_counter()
+        wait(pending, timeout=settings.PREFETCH_WAIT_SECONDS)
+        return time.perf_counter() - started
+
+    def search(self, query: str, k: int = 5) -> list:
+        """Returns cached results for a similar enough query, else searches (reusing the query vector)."""
+        embedding = self.index.embedding_function.embed_query(query)
+        unit = _unit(embedding)
+        waited = self._wait_for_prefetch()
+
+        with self._lock:
+            self.lookups += 1
+            candidates = [entry for entry in self._entries if entry.k >= k]
+        best, best_similarity = None, -1.0
+        for entry in candidates:
+            similarity = float(np.dot(unit, entry.embedding))
+            if similarity > best_similarity:
+                best, best_similarity = entry, similarity
+
+        if best is not None and best_similarity >= self.threshold:
+            with self._lock:
+                self.hits += 1
+                self.seconds_saved += max(best.search_seconds - waited, 0.0)
+            source = "prefetched" if best.prefetched else "cached"
+            print(f"Retrieval cache hit ({source}, similarity {best_similarity:.2f}): '{best.query[:60]}'")
+            return best.results[:k]
+        with self._lock:
+            self.seconds_saved -= waited # Waiting for the prefetch was in vain
+        return self._fetch(query, k, embedding).results
+
+    # --- Reporting ---
+    def close(self) -> dict:
+        """Cancels prefetches that have not started, releases the index, logs and returns the run's cache statistics."""
+        for future in self._pending:
+            future.cancel()
+        wait(self._pending) # Prefetches already searching still use the index
+        self.index.release()
+        stats = {
+            "lookups": self.lookups,
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.lookups, 3) if self.lookups else None,
+            "seconds_saved": round(self.seconds_saved, 3),
+            "prefetch_seconds": round(self.prefetch_seconds, 3),
+            "prefetch_failures": self.prefetch_failures,
+        }
+        _totals.add(stats)
+        print(f"Retrieval cache: {self.hits}/{self.lookups} tool searches served from cache, "
+              f"net ~{stats['seconds_saved']}s of retrieval latency saved "
+              f"(prefetch used {stats['prefetch_seconds']}s of background time, "
+              f"{stats['prefetch_failures']} of {len(self._pending)} prefetches failed). {_totals.summary()}")
+        return stats
+
+
+class _PrefetchTotals:
+    """Hit rate and latency saved across all runs of this process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.runs = self.lookups = self.hits = 0
+        self.seconds_saved = 0.0
+
+    def add(self, stats: dict):
+        with self._lock:
+            self.runs += 1
+            self.lookups += stats["lookups"]
+            self.hits += stats["hits"]
+            self.seconds_saved += stats["seconds_saved"]
+
+    def summary(self) -> str:
+        with self._lock:
+            rate = f"{self.hits / self.lookups:.0%}" if self.lookups else "n/a"
+            return f"All runs: {self.runs} runs, hit rate {rate}, ~{self.seconds_saved:.1f}s saved."
+
+
+_totals = _PrefetchTotals()
+
+
+def start_prefetch(client_query: str, k: int = 5) -> RetrievalCache | None:
+    """Creates the retrieval cache of a run and starts prefetching for it. None if disabled or no index."""
+    if not settings.PREFETCH_ENABLED:
+        return None
+    index = acquire_active_index()
+    if index is None:
+        return None
+    if index.embedding_function is None:
+        index.release()
+        return None
+    cache = RetrievalCache(index)
+    cache.prefetch(prefetch_queries(client_query), k)
+    return cache
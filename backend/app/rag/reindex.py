@@ -0,0 +1,140 @@
+# backend/app/rag/reindex.py
+
+import threading
+import traceback
+from datetime import datetime, timezone
+
+from backend.app.core.config import settings
+from backend.app.rag import retriever
+from backend.app.rag.indexer import build_vector_index
+from backend.app.rag.generations import (
+    create_generation_dir,
+    generation_path,
+    list_generations,
+    make_generation_meta,
+    read_generation_meta,
+    write_generation_meta,
+    set_current_generation,
+    remove_generation,
+    prune_generations,
+)
+
+# Probe used to check that a freshly built generation can actually answer queries
+VALIDATION_QUERY = "direito civil contrato"
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def validate_index(index: retriever.ActiveIndex, expected_chunks: int):
+    """Raises ValueError if the opened index is empty, incomplete, or cannot answer a probe query."""
+    stored_chunks = index.vector_store._collection.count()
+    if stored_chunks != expected_chunks:
+        raise ValueError(f"Index holds {stored_chunks} chunks, expected {expected_chunks}.")
+    results = index.vector_store.similarity_search(VALIDATION_QUERY, k=1)
+    if not results:
+        raise ValueError("Probe query returned no results.")
+
+
+class ReindexManager:
+    """
+    Runs index rebuilds in a background thread and hot-swaps the result into the retriever.
+
+    A rebuild goes: new generation directory -> build -> validate -> CURRENT pointer -> swap.
+    Any failure before the swap leaves the served index untouched and deletes the partial generation.
+    Only one rebuild runs at a time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+        self.status = {"state": "idle"}
+
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, embedding_model_type: str = None, embedding_model_name: str = None,
+              skip_extraction: bool = False) -> dict:
+        """
+        Starts a rebuild, optionally with a different embedding model than the one in .env.
+        Raises RuntimeError if a rebuild is already running.
+        """
+        model_type = embedding_model_type or settings.EMBEDDING_MODEL_TYPE
+        if model_type not in ["local", "google"]:
+            raise ValueError("embedding_model_type must be 'local' or 'google'")
+        model_name = embedding_model_name or retriever.get_embedding_model_name(model_type)
+
+        with self._lock:
+            if self.is_running():
+                raise RuntimeError("An index rebuild is already running.")
+            self.status = {
+                "state": "building",
+                "generation": None,
+                "embedding_model_type": model_type,
+                "embedding_model_name": model_name,
+                "started_at": _now(),
+            }
+            self._thread = threading.Thread(
+                target=self._run,
+                args=(model_type, model_name, skip_extraction),
+                name="index-rebuild",
+                daemon=True,
+            )
+            self._thread.start()
+            return dict(self.status)
+
+    def _run(self, model_type: str, model_name: str, skip_extraction: bool):
+        name, new_index = None, None
+        activated = False
+        try:
+            name, path = create_generation_dir()
+            self.status["generation"] = name
+            print(f"--- Building index generation {name} with {model_type} model '{model_name}' ---")
+
+            embedding_function = retriever.get_cached_embedding_function(model_type, model_name)
+            stats = build_vector_index(path, embedding_function, skip_extraction)
+            if not stats["chunks"]:
+                raise ValueError("No chunks were produced; nothing to index.")
+
+            meta = make_generation_meta(model_type, model_name, stats)
+            write_generation_meta(name, meta)
+
+            self.status["state"] = "validating"
+            new_index = retriever.open_index(path, name, meta)
+            validate_index(new_index, stats["chunks"])
+
+            # Point CURRENT at the new generation first, so a restart comes back on it too
+            set_current_generation(name)
+            retriever.activate_index(new_index)
+            activated = True
+            try:
+                prune_generations(in_use=retriever.open_generations())
+            except OSError as e:
+                print(f"Warning: Could not remove old index generations: {e}")
+
+            self.status.update({"state": "succeeded", "finished_at": _now(), "stats": stats})
+            print(f"--- Index generation {name} is now active ---")
+        except Exception as e:
+            print(f"!!! ERROR during index rebuild: {e} !!!")
+            traceback.print_exc()
+            if name and not activated:
+                if new_index is not None:
+                    new_index.close()
+                remove_generation(name)
+            self.status.update({"state": "failed", "finished_at": _now(), "error": str(e)[:500]})
+
+    def activate(self, name: str) -> dict:
+        """Switches to an existing generation (e.g. to roll back). Raises ValueError if it does not exist."""
+        if name not in list_generations():
+            raise ValueError(f"Unknown index generation: {name}")
+        with self._lock:
+            if self.is_running():
+                raise RuntimeError("An index rebuild is running; wait for it to finish.")
+            meta = read_generation_meta(name)
+            retriever.activate_index(retriever.open_index(generation_path(name), name, meta))
+            set_current_generation(name)
+        return {"generation": name, **meta}
+
+
+reindex_manager = ReindexManager()
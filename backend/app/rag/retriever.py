@@ -1,27 +1,45 @@
 # backend/app/rag/retriever.py
 
 import chromadb
+from chromadb.api.client import SharedSystemClient
 
 from langchain_community.vectorstores import Chroma
 from langchain_community.embeddings import SentenceTransformerEmbeddings # For local models
 from langchain_google_genai import GoogleGenerativeAIEmbeddings # Specific import for Google
 
 from backend.app.core.config import settings
+from backend.app.rag.dedup import CHUNK_DUPLICATE_COUNT_KEY
+from backend.app.rag.generations import get_current_generation, generation_path, read_generation_meta
+from backend.app.rag.hierarchy import (
+    ARTICLE_SUMMARY_COLLECTION_NAME,
+    DOCUMENT_SUMMARY_COLLECTION_NAME,
+    SearchScope,
+    search_in_scope,
+)
+from backend.app.rag.templates import load_template_index, normalize_document_type
 import google.generativeai as genai # Keep this for configuration
 import os 
+import threading
 import traceback # For better error logging
 
 # --- Embedding Function Setup ---
-def get_embedding_function():
-    """Gets the appropriate embedding function based on settings."""
-    if settings.EMBEDDING_MODEL_TYPE == "google":
-        print(f"Using Google Embedding Model: {settings.GOOGLE_EMBEDDING_MODEL_NAME}")
+def get_embedding_function(model_type: str = None, model_name: str = None):
+    """
+    Gets the appropriate embedding function based on settings.
+
+    model_type/model_name override the configured embedding model, e.g. when building or
+    loading an index generation that uses a different model than the .env default.
+    """
+    model_type = model_type or settings.EMBEDDING_MODEL_TYPE
+    if model_type == "google":
+        model_name = model_name or settings.GOOGLE_EMBEDDING_MODEL_NAME
+        print(f"Using Google Embedding Model: {model_name}")
         # Configure googleai API key if needed (might be handled by langchain-google-genai automatically)
         # genai.configure(api_key=settings.GOOGLE_API_KEY) # Consider if needed or handled by the class
         try:
             # Use the correct class imported above
             embeddings = GoogleGenerativeAIEmbeddings(
-                model=settings.GOOGLE_EMBEDDING_MODEL_NAME,
+                model=model_name,
                 google_api_key=settings.GOOGLE_API_KEY # Pass API key explicitly if required
             )
             return embeddings
@@ -29,12 +47,13 @@ def get_embedding_function():
             print(f"Error initializing GoogleGenerativeAIEmbeddings: {e}")
             raise # Re-raise the exception to signal failure
 
-    elif settings.EMBEDDING_MODEL_TYPE == "local":
-        print(f"Using Local Sentence Transformer Model: {settings.EMBEDDING_MODEL_NAME}")
+    elif model_type == "local":
+        model_name = model_name or settings.EMBEDDING_MODEL_NAME
+        print(f"Using Local Sentence Transformer Model: {model_name}")
         try:
             # Use the correct class imported above
             embeddings = SentenceTransformerEmbeddings(
-                model_name=settings.EMBEDDING_MODEL_NAME
+                model_name=model_name
                 # Specify device if needed, e.g., model_kwargs={'device': 'cpu'}
             )
             return embeddings
@@ -43,51 +62,240 @@ def get_embedding_function():
             raise # Re-raise the exception to signal failure
     else:
         # Should have been caught by config validation, but good to check
-        raise ValueError(f"Unsupported EMBEDDING_MODEL_TYPE in config: {settings.EMBEDDING_MODEL_TYPE}")
-
-# --- ChromaDB Client and Collection ---
-# Ensure ChromaDB path exists
-os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True) # Now 'os' is defined
-client = chromadb.PersistentClient(path=settings.VECTOR_DB_PATH)
-# You might need to explicitly get or create the collection if Chroma() doesn't handle it
-# collection_name = "legal_documents"
-# collection = client.get_or_create_collection(name=collection_name)
-
-# --- LangChain VectorStore Interface ---
-# Initialize embedding function *once* for efficiency if possible,
-# but handle potential errors during initialization
-try:
-    embedding_function_instance = get_embedding_function()
-except Exception as e:
-    print(f"CRITICAL: Failed to initialize embedding function. RAG will not work. Error: {e}")
-    embedding_function_instance = None # Set to None to indicate failure
-
-
-# Check if embedding function initialized successfully before creating vector_store
-if embedding_function_instance:
-    vector_store = Chroma(
-        client=client,
+        raise ValueError(f"Unsupported EMBEDDING_MODEL_TYPE in config: {model_type}")
+
+def get_embedding_model_name(model_type: str = None) -> str:
+    """Returns the configured embedding model name for the given (or configured) model type."""
+    model_type = model_type or settings.EMBEDDING_MODEL_TYPE
+    return settings.GOOGLE_EMBEDDING_MODEL_NAME if model_type == "google" else settings.EMBEDDING_MODEL_NAME
+
+# Embedding models are expensive to load, so they are shared between index generations using the same model
+_embedding_functions = {}
+_embedding_functions_lock = threading.Lock()
+
+def get_cached_embedding_function(model_type: str = None, model_name: str = None):
+    """Like get_embedding_function(), but returns the same instance for repeated (model_type, model_name) pairs."""
+    model_type = model_type or settings.EMBEDDING_MODEL_TYPE
+    model_name = model_name or get_embedding_model_name(model_type)
+    with _embedding_functions_lock:
+        key = (model_type, model_name)
+        if key not in _embedding_functions:
+            _embedding_functions[key] = get_embedding_function(model_type, model_name)
+        return _embedding_functions[key]
+
+# --- Active Index ---
+# ChromaDB caches one client system (SQLite connections, loaded HNSW segments) per path for the
+# life of the process. An index swapped out is closed, stopping that system, once the last
+# query or run still using it releases it; only then may its generation directory be deleted.
+_open_indexes = set()
+_open_lock = threading.Lock()
+
+class ActiveIndex:
+    """An opened vector index: the ChromaDB client, its LangChain wrapper and where it came from."""
+
+    def __init__(self, path: str, vector_store, generation: str = None, meta: dict = None,
+                 embedding_function=None, summary_store=None, templates: dict = None, scope: SearchScope = None,
+                 client=None):
+        self.path = path
+        self.vector_store = vector_store
+        self.generation = generation # None for the legacy VECTOR_DB_PATH index
+        self.meta = meta or {}
+        self.embedding_function = embedding_function
+        self.summary_store = summary_store # Document summaries, if built (see rag/hierarchy.py)
+        self.scope = scope # Article summary and chunk vectors for the coarse-to-fine search
+        self.templates = templates or {} # Normalized document type -> template structure (see rag/templates.py)
+        self.client = client
+        self._lock = threading.Lock()
+        self._users = 0
+        self._retired = False
+        self._closed = False
+
+    def acquire(self) -> "ActiveIndex":
+        with self._lock:
+            self._users += 1
+        return self
+
+    def release(self):
+        with self._lock:
+            self._users -= 1
+            close = self._retired and self._users == 0
+        if close:
+            self.close()
+
+    def retire(self):
+        """Marks the index as swapped out: it is closed as soon as nobody uses it any more."""
+        with self._lock:
+            self._retired = True
+            close = self._users == 0
+        if close:
+            self.close()
+
+    def close(self):
+        """Stops the ChromaDB client system of the index, unless another open index shares its path."""
+        with _open_lock:
+            if self._closed:
+                return
+            self._closed = True
+            _open_indexes.discard(self)
+            shared = any(other.path == self.path for other in _open_indexes)
+        if self.client is None or shared:
+            return
+        stop_client_system(self.client._identifier)
+        print(f"Closed index: {self.generation or self.path}")
+
+def stop_client_system(path: str):
+    """Stops and forgets ChromaDB's cached client system for path (e.g. the one left behind by an index build)."""
+    system = SharedSystemClient._identifer_to_system.pop(path, None)
+    if system is not None:
+        system.stop()
+
+def open_index(path: str, generation: str = None, meta: dict = None) -> ActiveIndex:
+    """Opens the ChromaDB index at path with the embedding model it was built with."""
+    meta = meta or {}
+    embedding_function = get_cached_embedding_function(
+        meta.get("embedding_model_type"), meta.get("embedding_model_name")
+    )
+    index_client = chromadb.PersistentClient(path=path)
+    # You might need to explicitly get or create the collection if Chroma() doesn't handle it
+    # collection_name = "legal_documents"
+    # collection = client.get_or_create_collection(name=collection_name)
+    store = Chroma(
+        client=index_client,
         # collection_name=collection_name, # Use the same name if specified above
-        embedding_function=embedding_function_instance,
-        persist_directory=settings.VECTOR_DB_PATH # May be redundant with PersistentClient
+        embedding_function=embedding_function,
+        persist_directory=path # May be redundant with PersistentClient
     )
-else:
-    vector_store = None # Indicate that the vector store couldn't be initialized
+    summary_store, scope = None, None
+    # Indexes built straight into VECTOR_DB_PATH have no generation.json, so look for the collections themselves
+    collections = {c.name for c in index_client.list_collections()}
+    if DOCUMENT_SUMMARY_COLLECTION_NAME in collections:
+        summary_store = Chroma(
+            client=index_client,
+            collection_name=DOCUMENT_SUMMARY_COLLECTION_NAME,
+            embedding_function=embedding_function,
+        )
+        article_store = Chroma(
+            client=index_client,
+            collection_name=ARTICLE_SUMMARY_COLLECTION_NAME,
+            embedding_function=embedding_function,
+        ) if ARTICLE_SUMMARY_COLLECTION_NAME in collections else None
+        scope = SearchScope(store._collection, summary_store._collection, article_store._collection if article_store else None)
+    index = ActiveIndex(path, store, generation, meta, embedding_function, summary_store, load_template_index(path),
+                        scope, index_client)
+    with _open_lock:
+        _open_indexes.add(index)
+    return index
+
+def open_generations() -> set:
+    """Generations with an index that is still open in this process (and must not be deleted)."""
+    with _open_lock:
+        return {index.generation for index in _open_indexes if index.generation}
+
+def _open_startup_index() -> ActiveIndex | None:
+    """Opens the CURRENT index generation if there is one, else the legacy VECTOR_DB_PATH index."""
+    generation = get_current_generation()
+    try:
+        if generation:
+            print(f"Opening index generation: {generation}")
+            return open_index(generation_path(generation), generation, read_generation_meta(generation))
+        # Ensure ChromaDB path exists
+        os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
+        return open_index(settings.VECTOR_DB_PATH)
+    except Exception as e:
+        print(f"CRITICAL: Failed to initialize embedding function or vector store. RAG will not work. Error: {e}")
+        traceback.print_exc()
+        return None # Indicate that the vector store couldn't be initialized
+
+# Queries take this reference exactly once (acquire_active_index), so swapping it never affects a
+# query already in flight: that query keeps using (and holding open) the index it started with.
+_active_index = _open_startup_index()
+_swap_lock = threading.Lock()
+
+def get_active_index() -> ActiveIndex | None:
+    return _active_index
 
-def search_knowledge_base(query: str, k: int = 5) -> list[str]:
-    """Searches the vector store for relevant documents."""
-    if not vector_store:
+def acquire_active_index() -> ActiveIndex | None:
+    """The active index, held open until its release() even if it is swapped out meanwhile."""
+    with _swap_lock:
+        return _active_index.acquire() if _active_index else None
+
+def activate_index(index: ActiveIndex) -> ActiveIndex | None:
+    """
+    Atomically makes `index` the one served by search_knowledge_base. Returns the previous one,
+    which is closed once the queries and runs still using it release it.
+    """
+    global _active_index
+    with _swap_lock:
+        previous = _active_index
+        _active_index = index
+    print(f"Active index switched to: {index.generation or index.path}")
+    if previous is not None and previous is not index:
+        previous.retire()
+    return previous
+
+def search_documents(query: str, k: int = 5, index: ActiveIndex = None, query_embedding: list = None) -> list:
+    """
+    Returns the k most relevant chunks as LangChain Documents (with metadata).
+
+    If the index has summary collections, the search is coarse-to-fine: relevant documents
+    and their relevant articles are picked first and only their chunks are ranked.
+    Pass query_embedding if the query has already been embedded with the index's model.
+    """
+    index = index or _active_index
+    if not index:
+        raise RuntimeError("Vector store not initialized (likely due to embedding function failure).")
+    if query_embedding is None:
+        if index.summary_store is None:
+            return index.vector_store.similarity_search(query, k=k)
+        query_embedding = index.embedding_function.embed_query(query)
+    if index.summary_store is None:
+        return index.vector_store.similarity_search_by_vector(query_embedding, k=k)
+
+    results = search_in_scope(index.scope, query_embedding, k)
+    if results is None:
+        return index.vector_store.similarity_search_by_vector(query_embedding, k=k)
+    if len(results) < k:
+        # The selected documents were too narrow; top up from the whole index
+        seen = {doc.page_content for doc in results}
+        for doc in index.vector_store.similarity_search_by_vector(query_embedding, k=k):
+            if len(results) >= k:
+                break
+            if doc.page_content not in seen:
+                results.append(doc)
+    return results
+
+def search_knowledge_base(query: str, k: int = 5, cache=None) -> list[str]:
+    """
+    Searches the vector store for relevant documents.
+    If a run's RetrievalCache is given (see rag/prefetch.py), it is consulted first.
+    """
+    # A run's cache holds its index open; a search without one holds the active index until it is done
+    index = cache.index if cache else acquire_active_index()
+    if not index:
         print("Error: Vector store not initialized (likely due to embedding function failure).")
         return ["Error: Knowledge base search is unavailable."]
 
     print(f"Searching knowledge base for: '{query}' (top {k} results)")
     try:
-        retriever = vector_store.as_retriever(search_kwargs={"k": k})
-        results = retriever.get_relevant_documents(query)
+        results = cache.search(query, k) if cache else search_documents(query, k, index)
         print(f"Found {len(results)} relevant document chunks.")
+        # Each of these would otherwise have competed for a top-k slot (see rag/dedup.py)
+        collapsed = sum(doc.metadata.get(CHUNK_DUPLICATE_COUNT_KEY, 0) for doc in results)
+        if collapsed:
+            print(f"Results stand in for {collapsed} near-duplicate chunk(s) removed at index time.")
         # Return content of the documents
         return [doc.page_content for doc in results] if results else ["No relevant information found in the knowledge base."]
     except Exception as e:
         print(f"Error during knowledge base search: {e}")
         traceback.print_exc() # Print full traceback for debugging
-        return [f"Error during search: {e}"]
\ No newline at end of file
+        return [f"Error during search: {e}"]
+    finally:
+        if not cache:
+            index.release()
+
+def get_document_template(document_type: str) -> dict | None:
+    """Returns the template of the active index for document_type (exact lookup, no search), or None."""
+    index = _active_index
+    if not index:
+        return None
+    return index.templates.get(normalize_document_type(document_type))
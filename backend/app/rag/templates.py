@@ -0,0 +1,219 @@
+# backend/app/rag/templates.py
+
+import json
+import os
+import re
+import unicodedata
+
+from backend.app.core.config import settings
+
+# --- Document Template Index ---
+# The example documents in legal_docs/doc_examples are not legal sources. They are kept out
+# of the vector index and compiled at index time into document_templates.json, next to the
+# ChromaDB files of the index. That file maps a document type to the structure of its template
+# (title, sections, fields to fill in, closing). The consolidation task gets the template for
+# the requested document_type by a dict lookup, with no vector search or tool call.
+TEMPLATES_DIR_NAME = "doc_examples"
+TEMPLATE_INDEX_FILE = "document_templates.json"
+TEMPLATE_INDEX_VERSION = 1
+
+# Pattern on the normalized (lower-case, unaccented) file name -> document type.
+# Templates that match none are keyed by their file title.
+TEMPLATE_DOCUMENT_TYPES = [
+    (re.compile(r"arrendamento"), "Rental Contract"),
+    (re.compile(r"comodato"), "Loan for Use Contract"),
+    (re.compile(r"divorcio"), "Divorce Petition"),
+]
+
+# Outlines for the output formats offered by the frontend, which have no example document
+BUILTIN_TEMPLATES = {
+    "Legal Opinion": [
+        "Introduction: the client and the question asked",
+        "Facts as understood",
+        "Applicable law (cite the provisions found by the experts)",
+        "Analysis",
+        "Conclusion and recommendations",
+        "Disclaimer",
+    ],
+    "Formal Letter": [
+        "Sender, recipient, place and date",
+        "Subject line",
+        "Salutation",
+        "Body: purpose of the letter, legal position with cited provisions, requested action and deadline",
+        "Closing and signature",
+        "Disclaimer",
+    ],
+    "Case Summary": [
+        "Parties and matter",
+        "Relevant facts",
+        "Legal issues",
+        "Applicable law",
+        "Assessment per issue",
+        "Outcome / next steps",
+        "Disclaimer",
+    ],
+    "Analysis Points": [
+        "One numbered point per legal issue: issue, applicable provision, short assessment",
+        "Open questions and missing facts",
+        "Disclaimer",
+    ],
+}
+
+# Headings in the templates: "Cláusula Primeira", "CLÁUSULA 1.ª", "Artigo 3.º", "ENTRE:" and other short all-caps lines.
+# Documents without such headings (petitions) are structured by their numbered paragraphs ("1.Os requerentes ...").
+_CLAUSE_RE = re.compile(r"^(?:Cl[aá]usula|CL[AÁ]USULA|Artigo|ARTIGO)\s+\S+")
+_NUMBERED_RE = re.compile(r"^\d{1,2}\.\s?[A-ZÀ-Ý]")
+_PAREN_TITLE_RE = re.compile(r"^\(([^)]{2,60})\)$")
+_PLACEHOLDER_RE = re.compile(r"\(([^()]{3,120})\)")
+_BLANK_RE = re.compile(r"(?:\.{3,}|…|_{3,}|\(\s*(?:…|\.\.\.)\s*\))")
+MAX_SECTIONS = 40
+MAX_PLACEHOLDERS = 15
+EXCERPT_CHARS = 600
+
+
+def normalize_document_type(document_type: str) -> str:
+    """Lookup key for a document type: case-, accent- and whitespace-insensitive."""
+    text = unicodedata.normalize("NFKD", document_type or "")
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+
+# Normalized name -> name of every document type the app knows, builtin or compiled from doc_examples
+KNOWN_DOCUMENT_TYPES = {
+    normalize_document_type(document_type): document_type
+    for document_type in [*BUILTIN_TEMPLATES, *(document_type for _, document_type in TEMPLATE_DOCUMENT_TYPES)]
+}
+
+
+def is_template_document(metadata: dict) -> bool:
+    """True for pages from legal_docs/doc_examples."""
+    source = os.path.abspath(metadata.get("source", ""))
+    templates_dir = os.path.abspath(os.path.join(settings.LEGAL_DOCS_PATH, TEMPLATES_DIR_NAME))
+    return source.startswith(templates_dir + os.sep)
+
+
+def template_document_type(source: str) -> str:
+    title = unicodedata.normalize("NFC", os.path.splitext(os.path.basename(source))[0])
+    for pattern, document_type in TEMPLATE_DOCUMENT_TYPES:
+        if pattern.search(normalize_document_type(title)):
+            return document_type
+    title = re.sub(r"^(?:modelo|minuta)\s+(?:d[eoa]s?\s+)?", "", title.replace("-", " "), flags=re.I)
+    return re.sub(r"\s+", " ", title).strip().title()
+
+
+# --- Structure Extraction ---
+def _clean_line(line: str) -> str:
+    # pypdf splits some accented words ("fraçã o"); collapsing whitespace is as far as we go
+    return re.sub(r"\s+", " ", line).strip()
+
+
+def _is_caps_heading(line: str) -> bool:
+    letters = [c for c in line if c.isalpha()]
+    return 3 <= len(letters) and len(line) <= 80 and all(c.isupper() for c in letters)
+
+
+def extract_template_structure(pages: list) -> dict:
+    """
+    Extracts the skeleton of a template from its pages (in order): the title, the section
+    headings, the fields left blank to fill in and the closing lines (signatures, date).
+    """
+    lines = [_clean_line(line) for page in pages for line in page.page_content.splitlines()]
+    lines = [line for line in lines if line]
+
+    sections, clauses = [], 0
+    for i, line in enumerate(lines[1:], start=1): # lines[0] is the title
+        if _CLAUSE_RE.match(line) and len(line) <= 80:
+            # The clause title is often on the next line, e.g. "Cláusula Primeira" / "(Objeto)"
+            title = _PAREN_TITLE_RE.match(lines[i + 1]) if i + 1 < len(lines) else None
+            sections.append(f"{line} ({title.group(1)})" if title else line)
+            clauses += 1
+        elif _is_caps_heading(line):
+            sections.append(line)
+    if not clauses:
+        sections.extend(line[:80] for line in lines if _NUMBERED_RE.match(line))
+
+    placeholders = []
+    for line in lines:
+        if not _BLANK_RE.search(line):
+            continue
+        for match in _PLACEHOLDER_RE.finditer(line):
+            field = match.group(1).strip()
+            if not _BLANK_RE.fullmatch(field) and field not in placeholders:
+                placeholders.append(field)
+
+    # Closing: the short lines at the very end (place/date, signatures)
+    closing = [line for line in lines[-8:] if len(line) <= 60 and not line[0].islower()]
+
+    return {
+        "title": lines[0] if lines else "",
+        "sections": sections[:MAX_SECTIONS],
+        "placeholders": placeholders[:MAX_PLACEHOLDERS],
+        "closing": closing,
+        "excerpt": " ".join(lines)[:EXCERPT_CHARS],
+    }
+
+
+def build_template_index(template_pages: list) -> dict:
+    """
+    Builds the template index from the pages of legal_docs/doc_examples, plus the built-in
+    outlines of the frontend document types. Returns the JSON-ready index.
+    """
+    pages_by_source = {}
+    for page in template_pages:
+        pages_by_source.setdefault(page.metadata.get("source", ""), []).append(page)
+
+    templates = {}
+    for document_type, sections in BUILTIN_TEMPLATES.items():
+        templates[normalize_document_type(document_type)] = {
+            "document_type": document_type, "origin": "builtin", "sections": sections,
+        }
+    for source, pages in sorted(pages_by_source.items()):
+        pages.sort(key=lambda page: page.metadata.get("page", 0))
+        document_type = template_document_type(source)
+        structure = extract_template_structure(pages)
+        templates[normalize_document_type(document_type)] = {
+            "document_type": document_type,
+            "origin": "example",
+            "source": os.path.relpath(source, settings.LEGAL_DOCS_PATH),
+            **structure,
+        }
+        print(f"Template '{document_type}': {len(structure['sections'])} sections, "
+              f"{len(structure['placeholders'])} fields, from {os.path.basename(source)}")
+    return {"version": TEMPLATE_INDEX_VERSION, "templates": templates}
+
+
+def write_template_index(index_dir: str, template_index: dict):
+    os.makedirs(index_dir, exist_ok=True)
+    path = os.path.join(index_dir, TEMPLATE_INDEX_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(template_index, f, ensure_ascii=False, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def load_template_index(index_dir: str) -> dict:
+    """Loads the templates of an index; indexes built before templates existed get the built-in outlines."""
+    path = os.path.join(index_dir, TEMPLATE_INDEX_FILE)
+    if not os.path.exists(path):
+        return build_template_index([])["templates"]
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)["templates"]
+
+
+# --- Prompt Rendering ---
+def format_template_for_prompt(template: dict | None) -> str:
+    """Renders a template as instructions for the consolidation task."""
+    if not template:
+        return "No template is available for this document type; use the structure customary for it."
+    lines = [f"Follow this structure for a '{template['document_type']}':"]
+    if template.get("title"):
+        lines.append(f"Title: {template['title']}")
+    lines.extend(f"- {section}" for section in template["sections"])
+    if template.get("placeholders"):
+        lines.append("Fields the template leaves to fill in (use the client's facts, or mark them as to be completed): "
+                     + "; ".join(template["placeholders"]))
+    if template.get("closing"):
+        lines.append("Closing: " + " / ".join(template["closing"]))
+    if template.get("excerpt"):
+        lines.append(f"Opening of the example document, for tone and wording: \"{template['excerpt']}\"")
+    return "\n".join(lines)
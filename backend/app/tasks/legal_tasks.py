@@ -1,16 +1,10 @@
 # backend/app/tasks/legal_tasks.py
 
 from crewai import Task
-from backend.app.agents.legal_agents import (
-    legal_advisor,
-    labour_law_expert,
-    civil_law_expert,
-    fiscal_law_expert
-)
 
 # --- Define Task Templates ---
 
-def create_client_consultation_task():
+def create_client_consultation_task(agent):
     """
     Task for the Legal Advisor to understand client needs and plan expert engagement.
     """
@@ -34,10 +28,10 @@ def create_client_consultation_task():
           "- Confirmation of the final document type requested by the client (e.g., 'Legal Opinion').\n"
           "This summary will be passed as context to subsequent expert agents."
       ),
-      agent=legal_advisor,
+      agent=agent,
     )
 
-def create_labour_law_analysis_task():
+def create_labour_law_analysis_task(agent):
     """
     Task for the Labour Law Expert to analyze relevant aspects, if requested.
     """
@@ -58,10 +52,10 @@ def create_labour_law_analysis_task():
           "If specific questions were posed by the Lead Advisor: A detailed written analysis of the relevant international labour law aspects, directly addressing those points and citing sources from the knowledge base. "
           "If no specific questions were posed by the Lead Advisor for this domain: A brief statement confirming that your expertise was not deemed directly necessary for the core query, as per the Lead Advisor's initial assessment. Example: 'No specific International Labour Law analysis required for this query as per Lead Advisor's plan.'"
       ),
-      agent=labour_law_expert,
+      agent=agent,
     )
 
-def create_civil_law_analysis_task():
+def create_civil_law_analysis_task(agent):
     """
     Task for the Civil Law Expert to analyze relevant aspects.
     This agent is central to the 'divorce' query, so it will likely always receive questions.
@@ -79,10 +73,10 @@ def create_civil_law_analysis_task():
           "Cite specific articles or sources (e.g., Civil Code articles, case law summaries) found in the knowledge base. "
           "If no relevant civil law aspects are identified for this case (unlikely for a divorce query), or if the knowledge base yields no pertinent information for a specific question, clearly state this fact and the reasons."
       ),
-      agent=civil_law_expert,
+      agent=agent,
     )
 
-def create_fiscal_law_analysis_task():
+def create_fiscal_law_analysis_task(agent):
     """
     Task for the Fiscal Law Expert to analyze relevant aspects, if requested.
     """
@@ -103,10 +97,10 @@ def create_fiscal_law_analysis_task():
           "If specific questions were posed by the Lead Advisor: A detailed written analysis of the relevant Portuguese fiscal law aspects, directly addressing those points and citing sources from the knowledge base. "
           "If no specific questions were posed by the Lead Advisor for this domain: A brief statement confirming that your expertise was not deemed directly necessary for the core query, as per the Lead Advisor's initial assessment. Example: 'No specific Fiscal Law analysis required for this query as per Lead Advisor's plan.'"
       ),
-      agent=fiscal_law_expert,
+      agent=agent,
     )
 
-def create_final_consolidation_task():
+def create_final_consolidation_task(agent):
     """
     Task for the Lead Legal Advisor to consolidate expert analyses into a final response.
     """
@@ -118,7 +112,9 @@ def create_final_consolidation_task():
             "   Note that some experts might have responded that their domain was not directly relevant and provided a brief statement to that effect; incorporate this understanding.\n"
             "4. Focus on integrating the key findings from the experts who *did* provide substantive analysis into a single, coherent response.\n"
             "5. Ensure the consolidated response directly addresses the client's initial query and incorporates the most pertinent information from the expert analyses.\n"
-            "6. Structure the final output logically. If the requested document type was '{document_type}', try to adhere to a suitable structure for that type (e.g., for a 'Legal Opinion', include Introduction, Analysis based on expert input, Conclusion).\n"
+            "6. Structure the final output as a '{document_type}'. Use this template, taken from the document template index:\n"
+            "{document_template}\n"
+            "   Where the template has fields to fill in, use the facts from the client's query, or mark them clearly as to be completed.\n"
             "7. Use clear, professional language suitable for a client.\n"
             "8. CRITICAL: Include a standard disclaimer at the end of the document, stating that this is AI-generated information and not a substitute for consultation with a qualified human lawyer, and that the information is based on the knowledge available up to your last update and the provided RAG documents."
         ),
@@ -127,5 +123,5 @@ def create_final_consolidation_task():
             "This response must integrate the key findings from all contributing expert analyses (or note non-relevance if stated by an expert), directly address the client's original query {client_query}, be clearly written, and MUST include the specified disclaimer. "
             "If an expert indicated no relevant information for their domain as per your initial plan, this should be briefly noted if it provides useful context to the client (e.g., 'Fiscal implications were not analyzed as they were outside the scope of the initial query on eligibility.')."
         ),
-        agent=legal_advisor,
+        agent=agent,
     )
\ No newline at end of file
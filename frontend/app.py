@@ -31,7 +31,8 @@ with st.sidebar:
     st.header("Case Details")
     doc_type = st.selectbox(
         "Select Desired Output Format:", # Slightly rephrased for clarity
-        ("Legal Opinion", "Formal Letter", "Case Summary", "Analysis Points"), # Changed one option
+        ("Legal Opinion", "Formal Letter", "Case Summary", "Analysis Points", # Changed one option
+         "Rental Contract", "Loan for Use Contract", "Divorce Petition"), # Drafts based on the templates in doc_examples
         index=0 # Default to Legal Opinion
     )
     st.info(
@@ -66,13 +67,25 @@ if prompt and not st.session_state.processing:
             # Set a very long timeout for debugging, but consider UX for production
             response = requests.post(BACKEND_API_URL, json=payload, timeout=1800)
 
-            response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-
-            # --- Process Response ---
-            api_response = response.json()
-            assistant_response = api_response.get("result", "Error: No result found in API response from backend.")
-            # Update the placeholder with the actual response
-            message_placeholder.markdown(assistant_response)
+            if response.status_code == 429:
+                # The backend queue is full; it tells us when to come back
+                retry_after = response.headers.get("Retry-After", "a few")
+                detail = response.json().get("detail", "")
+                st.warning(f"The legal team is fully booked. {detail}")
+                assistant_response = f"Sorry, all legal advisory teams are busy right now. Please retry in {retry_after} seconds."
+                message_placeholder.markdown(assistant_response)
+            else:
+                response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
+
+                # --- Process Response ---
+                api_response = response.json()
+                assistant_response = api_response.get("result", "Error: No result found in API response from backend.")
+                # Update the placeholder with the actual response
+                message_placeholder.markdown(assistant_response)
+                usage = api_response.get("usage") or {}
+                if usage.get("degradations"):
+                    # The run hit its processing budget; the answer may be less thorough than usual
+                    st.caption("Shortened to stay within the processing budget: " + "; ".join(usage["degradations"]))
 
         except requests.exceptions.Timeout:
             st.error(f"The request to the backend timed out after {1800/60} minutes. The legal team is taking longer than expected. Please try a simpler query or check backend logs.")
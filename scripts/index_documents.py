@@ -2,6 +2,7 @@
 
 import sys
 import os
+import argparse
 import traceback
 
 # Calculate the absolute path to the project root directory (Malas/)
@@ -11,30 +12,33 @@ project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 if project_root not in sys.path:
     sys.path.insert(0, project_root)
 
-# Core libraries
-import chromadb
-from langchain_community.vectorstores import Chroma # Corrected import for deprecation
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFDirectoryLoader # Use community loader
-
 # Project-specific imports from backend
 try:
     from backend.app.core.config import settings
-    from backend.app.rag.retriever import get_embedding_function # Reuse the embedding function
+    from backend.app.rag.retriever import get_embedding_model_name
+    from backend.app.rag.page_store import build_page_store
+    from backend.app.rag.indexer import build_vector_index
+    from backend.app.rag.generations import (
+        create_generation_dir,
+        get_current_generation,
+        make_generation_meta,
+        remove_generation,
+        set_current_generation,
+        write_generation_meta,
+    )
 except ImportError as e:
     print(f"Error importing from backend: {e}")
     print(f"Project root added to path: {project_root}")
     print(f"Current sys.path: {sys.path}")
-    print("Please check that 'backend/app/core/config.py' and 'backend/app/rag/retriever.py' exist.")
+    print("Please check that 'backend/app/core/config.py' and the modules in 'backend/app/rag/' exist.")
     sys.exit(1)
 # --- End Imports ---
 
 
-# --- Indexing Logic ---
-def perform_indexing():
-    """Loads PDFs, splits them, creates embeddings, and stores them in ChromaDB."""
-    print(f"Starting document indexing process...")
-    print(f"Loading documents from: {settings.LEGAL_DOCS_PATH}")
+# --- Extraction Logic (Stage 1) ---
+def extract_pages():
+    """Parses new or changed PDFs into the page store. Unchanged PDFs are not parsed again."""
+    print(f"Extracting page text from: {settings.LEGAL_DOCS_PATH}")
 
     # Check if the document directory exists and is not empty
     if not os.path.exists(settings.LEGAL_DOCS_PATH):
@@ -49,69 +53,64 @@ def perform_indexing():
              print(f"Created empty vector database directory: {settings.VECTOR_DB_PATH}")
          return False # Indicate nothing was indexed, but not necessarily an error
 
-    # 1. Load Documents
-    print("Loading PDF documents...")
-    loader = PyPDFDirectoryLoader(settings.LEGAL_DOCS_PATH)
     try:
-        documents = loader.load()
-        if not documents:
-             print("No documents were loaded successfully from the directory (check PDF files).")
-             return False
-        print(f"Loaded {len(documents)} document pages/sections.")
+        stats = build_page_store(settings.LEGAL_DOCS_PATH, settings.PAGE_STORE_PATH)
     except Exception as e:
-        print(f"Error loading documents: {e}")
+        print(f"Error building page store: {e}")
         traceback.print_exc()
         return False
+    return stats["pages"] > 0
+# --- End Extraction Logic ---
 
-    # 2. Split Documents
-    print("Splitting documents into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,  # Adjust size as needed
-        chunk_overlap=200   # Adjust overlap as needed
-    )
-    try:
-        texts = text_splitter.split_documents(documents)
-        print(f"Split documents into {len(texts)} text chunks.")
-        if not texts:
-            print("No text chunks generated after splitting. Check document content and splitter settings.")
-            return False
-    except Exception as e:
-        print(f"Error splitting documents: {e}")
-        traceback.print_exc()
+
+# --- Indexing Logic (Stages 2 and 3) ---
+def perform_indexing(skip_extraction: bool = False, new_generation: bool = False):
+    """
+    Fills the page store, splits the stored pages, creates embeddings, and stores them in ChromaDB.
+
+    With new_generation, the index is built into a fresh index generation which then becomes
+    CURRENT (served after an API restart, or right away via POST /api/v1/admin/index/activate).
+    """
+    print(f"Starting document indexing process...")
+
+    current = get_current_generation()
+    if current and not new_generation:
+        # The API serves the CURRENT generation; an index in VECTOR_DB_PATH would never be used
+        print(f"Error: index generation '{current}' is CURRENT, so the API does not serve {settings.VECTOR_DB_PATH}.")
+        print("Re-run with --new-generation to build an index the API will serve.")
         return False
 
-    # 3. Get Embedding Function
-    print("Initializing embedding function...")
-    try:
-        embedding_function = get_embedding_function()
-        if not embedding_function:
-             raise ValueError("Failed to get embedding function.")
-    except Exception as e:
-        print(f"Error getting embedding function: {e}")
-        traceback.print_exc()
+    if not skip_extraction and not extract_pages():
         return False
 
-    # 4. Create and Persist Vector Store
-    print(f"Creating/updating vector store at: {settings.VECTOR_DB_PATH}")
+    if new_generation:
+        generation, persist_directory = create_generation_dir()
+        print(f"Building new index generation: {generation}")
+    else:
+        generation, persist_directory = None, settings.VECTOR_DB_PATH
+
+    # Pages are read from the page store (no PDF parsing happens here), split, embedded and stored
     try:
-        # Ensure the target directory exists
-        os.makedirs(settings.VECTOR_DB_PATH, exist_ok=True)
-
-        vector_store = Chroma.from_documents(
-            documents=texts,
-            embedding=embedding_function,
-            persist_directory=settings.VECTOR_DB_PATH
-            # collection_name="legal_documents" # Optional: specify collection name if needed later
-        )
-
-        # Explicitly persist (good practice)
-        vector_store.persist()
-        print(f"Successfully indexed {len(texts)} chunks to {settings.VECTOR_DB_PATH}")
-        return True
+        stats = build_vector_index(persist_directory, skip_extraction=True)
+        if not stats["chunks"]:
+            print("No text chunks generated. Check the page store content and splitter settings.")
+            if generation:
+                remove_generation(generation)
+            return False
     except Exception as e:
         print(f"Error creating/persisting vector store: {e}")
         traceback.print_exc()
+        if generation:
+            remove_generation(generation)
         return False
+
+    if generation:
+        write_generation_meta(generation, make_generation_meta(
+            settings.EMBEDDING_MODEL_TYPE, get_embedding_model_name(), stats
+        ))
+        set_current_generation(generation)
+        print(f"Index generation {generation} is now CURRENT.")
+    return True
 # --- End Indexing Logic ---
 
 
@@ -120,7 +119,20 @@ if __name__ == "__main__":
     print("="*50)
     print("Running Standalone RAG Document Indexing Script")
     print("="*50)
-    success = perform_indexing() # Call the function defined above
+    parser = argparse.ArgumentParser(description="Index the legal PDF documents for RAG.")
+    stage_group = parser.add_mutually_exclusive_group()
+    stage_group.add_argument("--extract-only", action="store_true",
+                             help="Only parse PDFs into the page store; skip chunking and embedding.")
+    stage_group.add_argument("--skip-extract", action="store_true",
+                             help="Re-chunk and embed straight from the existing page store, without looking at the PDFs.")
+    parser.add_argument("--new-generation", action="store_true",
+                        help="Build into a new index generation and make it CURRENT instead of writing to VECTOR_DB_PATH.")
+    args = parser.parse_args()
+
+    if args.extract_only:
+        success = extract_pages()
+    else:
+        success = perform_indexing(skip_extraction=args.skip_extract, new_generation=args.new_generation) # Call the function defined above
     print("="*50)
     if success:
         print("Indexing completed successfully.")
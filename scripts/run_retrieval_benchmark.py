@@ -0,0 +1,95 @@
+# scripts/run_retrieval_benchmark.py
+
+import sys
+import os
+import argparse
+import json
+import traceback
+
+# Calculate the absolute path to the project root directory (Malas/)
+project_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Insert the project root directory at the beginning of the Python path
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# The benchmark runs offline: local embeddings and extractive hierarchy summaries, so no
+# Gemini calls are made and a placeholder key is enough to satisfy the settings check.
+os.environ.setdefault("GOOGLE_API_KEY", "offline-benchmark")
+os.environ["EMBEDDING_MODEL_TYPE"] = "local"
+os.environ["SUMMARY_BACKEND"] = "extractive"
+
+# Project-specific imports from backend
+try:
+    from backend.app.rag.benchmark import GOLDEN_SET_PATH, compare_results, run_benchmark
+except ImportError as e:
+    print(f"Error importing from backend: {e}")
+    print(f"Project root added to path: {project_root}")
+    print("Please check that the modules in 'backend/app/rag/' exist.")
+    sys.exit(1)
+# --- End Imports ---
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Run the retrieval benchmark (recall@k, MRR, top-k redundancy, latency, index size) against the golden query set."
+    )
+    parser.add_argument("--k", type=int, default=5, help="Number of chunks retrieved per query (default: 5).")
+    parser.add_argument("--model", default=None,
+                        help="Local SentenceTransformer model (default: EMBEDDING_MODEL_NAME, e.g. all-MiniLM-L6-v2).")
+    parser.add_argument("--golden-set", default=GOLDEN_SET_PATH, help="Golden set JSON file.")
+    parser.add_argument("--output", default=None, help="Write the results JSON to this file.")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to print deltas against.")
+    parser.add_argument("--repeats", type=int, default=3, help="Timed runs per query for the latency figures.")
+    parser.add_argument(
+        "--skip-extract",
+        action="store_true",
+        help="Build the benchmark index from the page store as-is, without checking the PDFs for changes."
+    )
+    parser.add_argument(
+        "--generation",
+        default=None,
+        help="Benchmark an existing (locally embedded) index generation instead of building a fresh index."
+    )
+    args = parser.parse_args()
+
+    try:
+        results = run_benchmark(
+            k=args.k,
+            embedding_model_name=args.model,
+            generation=args.generation,
+            golden_set_path=args.golden_set,
+            skip_extraction=args.skip_extract,
+            repeats=args.repeats,
+        )
+    except Exception as e:
+        print(f"Benchmark failed: {e}")
+        traceback.print_exc()
+        sys.exit(1)
+
+    quality = results["quality"]
+    print("\n--- Retrieval Benchmark ---")
+    print(f"Queries: {quality['queries']}  recall@{args.k}: {quality[f'recall@{args.k}']}  MRR: {quality['mrr']}  "
+          f"redundancy@{args.k}: {quality[f'redundancy@{args.k}']}")
+    for domain, domain_quality in quality["by_domain"].items():
+        print(f"  {domain:<10} recall@{args.k}: {domain_quality[f'recall@{args.k}']}  MRR: {domain_quality['mrr']}")
+    print(f"Latency p50: {results['latency_ms']['p50']} ms  p99: {results['latency_ms']['p99']} ms")
+    print(f"Index: {results['index']['chunks']} chunks, {results['index']['disk_bytes']} bytes on disk, "
+          f"{results['index']['index_memory_bytes']} bytes in memory, built in {results['index']['build_seconds']}s")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+        print(f"\n--- Compared to {args.compare} (commit {previous.get('commit')}) ---")
+        for line in compare_results(previous, results):
+            print(line)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
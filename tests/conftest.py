@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The tests import the app as `backend.app...`, like the API and scripts do, from the repo root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# config.py refuses to load without a key; nothing in these tests calls the LLM
+os.environ.setdefault("GOOGLE_API_KEY", "test-key")
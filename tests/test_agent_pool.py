@@ -0,0 +1,69 @@
+import sys
+import types
+
+import pytest
+
+
+class FakeAgent:
+    def __init__(self):
+        self.crew = None
+        self.tools_results = []
+        self.step_callback = None
+        self.max_execution_time = None
+
+
+class FakeAgentSet:
+    def __init__(self):
+        self.agents = [FakeAgent(), FakeAgent()]
+
+
+@pytest.fixture
+def agent_pool_module(monkeypatch):
+    """The agent_pool module, imported with a factory that builds plain objects instead of CrewAI agents."""
+    legal_agents = types.ModuleType("backend.app.agents.legal_agents")
+    legal_agents.AgentSet = FakeAgentSet
+    legal_agents.build_agent_set = FakeAgentSet
+    monkeypatch.setitem(sys.modules, "backend.app.agents.legal_agents", legal_agents)
+    monkeypatch.delitem(sys.modules, "backend.app.crew.agent_pool", raising=False)
+    from backend.app.crew import agent_pool
+    yield agent_pool
+    sys.modules.pop("backend.app.crew.agent_pool", None)
+
+
+def test_returned_sets_are_reset(agent_pool_module):
+    pool = agent_pool_module.AgentPool(size=1, factory=FakeAgentSet)
+    with pool.acquire(timeout=1) as agent_set:
+        assert pool.in_use == 1
+        agent = agent_set.agents[0]
+        agent.crew = "crew"
+        agent.tools_results.append("result")
+        agent.max_execution_time = 30
+    assert pool.in_use == 0
+    with pool.acquire(timeout=1) as reused:
+        assert reused is agent_set
+        assert (agent.crew, agent.tools_results, agent.max_execution_time) == (None, [], None)
+
+
+def test_set_that_fails_to_reset_is_replaced(agent_pool_module, monkeypatch):
+    pool = agent_pool_module.AgentPool(size=1, factory=FakeAgentSet)
+
+    def broken_reset(agent_set):
+        raise AttributeError("can't set attribute")
+
+    monkeypatch.setattr(agent_pool_module, "reset_agent_set", broken_reset)
+    with pool.acquire(timeout=1) as agent_set:
+        agent_set.agents[0].crew = "crew"
+    assert pool.in_use == 0
+    with pool.acquire(timeout=1) as replacement:
+        assert replacement is not agent_set
+        assert replacement.agents[0].crew is None
+
+
+def test_acquire_times_out_when_all_sets_are_busy(agent_pool_module):
+    pool = agent_pool_module.AgentPool(size=1, factory=FakeAgentSet)
+    with pool.acquire(timeout=1):
+        with pytest.raises(agent_pool_module.AgentPoolExhausted):
+            with pool.acquire(timeout=0.01):
+                pass
+    with pool.acquire(timeout=1):
+        assert pool.in_use == 1
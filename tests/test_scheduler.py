@@ -0,0 +1,153 @@
+import asyncio
+
+import pytest
+
+from backend.app.core.config import settings
+from backend.app.crew.scheduler import CrewScheduler, SchedulerRejected
+
+
+@pytest.fixture(autouse=True)
+def scheduler_settings(monkeypatch):
+    monkeypatch.setattr(settings, "CLIENT_WEIGHTS", {})
+    monkeypatch.setattr(settings, "CLIENT_MAX_CONCURRENT", 0)
+    monkeypatch.setattr(settings, "CLIENT_MAX_QUEUED", 5)
+    monkeypatch.setattr(settings, "SCHEDULER_MAX_QUEUED", 20)
+    monkeypatch.setattr(settings, "SCHEDULER_MAX_WAIT", 10_000)
+    monkeypatch.setattr(settings, "SCHEDULER_DEFAULT_RUN_SECONDS", 60)
+
+
+class Runs:
+    """Crew runs that record when they start and only end when released."""
+
+    def __init__(self):
+        self.started = []
+        self._release = {}
+
+    async def work(self, name):
+        self.started.append(name)
+        self._release[name] = asyncio.Event()
+        await self._release[name].wait()
+        return name
+
+    def release(self, name):
+        self._release[name].set()
+
+
+async def _settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_fair_share_serves_the_waiting_client_before_a_burst():
+    async def scenario():
+        scheduler, runs = CrewScheduler(slots=1), Runs()
+        burst = [asyncio.create_task(scheduler.run("a", "", runs.work, f"a{i}")) for i in range(3)]
+        await _settle()
+        single = asyncio.create_task(scheduler.run("b", "", runs.work, "b0"))
+        await _settle()
+        for name in ["a0", "b0", "a1", "a2"]:
+            assert runs.started[-1] == name
+            runs.release(name)
+            await _settle()
+        assert await asyncio.gather(*burst, single) == ["a0", "a1", "a2", "b0"]
+        assert scheduler.status()["completed"] == 4
+
+    asyncio.run(scenario())
+
+
+def test_per_client_limits(monkeypatch):
+    monkeypatch.setattr(settings, "CLIENT_MAX_CONCURRENT", 1)
+    monkeypatch.setattr(settings, "CLIENT_MAX_QUEUED", 1)
+
+    async def scenario():
+        scheduler, runs = CrewScheduler(slots=2), Runs()
+        tasks = [asyncio.create_task(scheduler.run("a", "", runs.work, f"a{i}")) for i in range(2)]
+        await _settle()
+        # The second slot is free, but client a may only run one crew at a time
+        assert runs.started == ["a0"]
+        with pytest.raises(SchedulerRejected) as rejected:
+            await scheduler.run("a", "", runs.work, "a2")
+        assert rejected.value.retry_after >= 1
+        assert scheduler.status()["rejected"] == 1
+        # Another client still gets the free slot
+        tasks.append(asyncio.create_task(scheduler.run("b", "", runs.work, "b0")))
+        await _settle()
+        assert runs.started == ["a0", "b0"]
+        for name in ["a0", "b0", "a1"]:
+            runs.release(name)
+            await _settle()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_while_queued_leaves_no_trace():
+    async def scenario():
+        scheduler, runs = CrewScheduler(slots=1), Runs()
+        running = asyncio.create_task(scheduler.run("a", "", runs.work, "a0"))
+        await _settle()
+        waiting = asyncio.create_task(scheduler.run("b", "", runs.work, "b0"))
+        await _settle()
+        assert scheduler.status()["queued"] == 1
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+        assert scheduler.status()["queued"] == 0
+        runs.release("a0")
+        await running
+        await _settle()
+        assert runs.started == ["a0"]
+        assert scheduler.status()["running"] == 0
+        assert scheduler.status()["clients"] == {}
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_right_after_dispatch_frees_the_slot():
+    async def scenario():
+        scheduler, runs = CrewScheduler(slots=1), Runs()
+        tasks = {}
+
+        async def first_run():
+            # Cancels b0 in the same loop iteration in which a0's end grants b0 the slot,
+            # before b0 gets to run (the scheduler's done callback is registered before this one)
+            asyncio.current_task().add_done_callback(lambda _: tasks["b0"].cancel())
+            return await runs.work("a0")
+
+        tasks["a0"] = asyncio.create_task(scheduler.run("a", "", first_run))
+        await _settle()
+        tasks["b0"] = asyncio.create_task(scheduler.run("b", "", runs.work, "b0"))
+        tasks["c0"] = asyncio.create_task(scheduler.run("c", "", runs.work, "c0"))
+        await _settle()
+        runs.release("a0")
+        await tasks["a0"]
+        with pytest.raises(asyncio.CancelledError):
+            await tasks["b0"]
+        await _settle()
+        # b0 never ran, and its slot went to the next client
+        assert runs.started == ["a0", "c0"]
+        assert scheduler.status()["running"] == 1
+        runs.release("c0")
+        await tasks["c0"]
+        await _settle()
+        assert scheduler.status()["running"] == 0
+        assert scheduler.status()["clients"] == {}
+
+    asyncio.run(scenario())
+
+
+def test_failed_runs_are_not_recorded():
+    async def fail():
+        raise RuntimeError("crew failed")
+
+    async def scenario():
+        scheduler = CrewScheduler(slots=1)
+        with pytest.raises(RuntimeError):
+            await scheduler.run("a", "", fail)
+        await _settle()
+        status = scheduler.status()
+        assert status["completed"] == 0
+        assert status["run_seconds_estimates"] == {}
+        assert status["running"] == 0
+
+    asyncio.run(scenario())